@@ -39,22 +39,182 @@ CREATE TABLE IF NOT EXISTS parameters (
 
 -- table of orders
 -- the relative_cos column store the price relative to the base_price of the product
+-- the base_price column store the base price of the product when the order was made
 CREATE TABLE IF NOT EXISTS orders (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     buyer_id INTEGER NOT NULL REFERENCES buyers(id),
     product_code TEXT NOT NULL REFERENCES products(code),
     -- NOTE: base_price is multiple of 1 NOK
     relative_cost INTEGER NOT NULL,
+    -- NOTE: base_price is multiple of 1 NOK
+    base_price INTEGER NOT NULL,
     tick_no INTEGER NOT NULL REFERENCES ticks(tick_no),
     created_at INTEGER NOT NULL DEFAULT (strftime('%s','now'))
 );
 
+-- sales per product and tick
+CREATE INDEX IF NOT EXISTS orders_product_tick_idx ON orders ( product_code, tick_no );
+-- orders by buyer, latest first
+CREATE INDEX IF NOT EXISTS orders_buyer_created_idx ON orders ( buyer_id, created_at );
+-- orders by time
+CREATE INDEX IF NOT EXISTS orders_created_idx ON orders ( created_at );
+
+-- running order totals per buyer, maintained by triggers on orders
+CREATE TABLE IF NOT EXISTS buyer_stats (
+    buyer_id INTEGER PRIMARY KEY REFERENCES buyers(id),
+    relative_cost_sum INTEGER NOT NULL DEFAULT 0,
+    order_count INTEGER NOT NULL DEFAULT 0,
+    last_order_at INTEGER DEFAULT NULL,
+    -- NOTE: turnover is multiple of 1 NOK
+    turnover INTEGER NOT NULL DEFAULT 0
+);
+
+-- buyers ranked by profit, the leaderboard reads it from both ends
+CREATE INDEX IF NOT EXISTS buyer_stats_relative_cost_idx ON buyer_stats ( relative_cost_sum );
+
+CREATE TRIGGER IF NOT EXISTS orders_buyer_stats_insert AFTER INSERT ON orders
+BEGIN
+    INSERT OR IGNORE INTO buyer_stats ( buyer_id ) VALUES ( NEW.buyer_id );
+    UPDATE buyer_stats SET
+        relative_cost_sum = relative_cost_sum + NEW.relative_cost,
+        order_count = order_count + 1,
+        last_order_at = MAX(COALESCE(last_order_at, NEW.created_at), NEW.created_at),
+        turnover = turnover + NEW.relative_cost + NEW.base_price
+    WHERE buyer_id = NEW.buyer_id;
+END;
+
+-- units sold and revenue per product and tick, maintained by triggers on orders
+CREATE TABLE IF NOT EXISTS tick_sales (
+    tick_no INTEGER NOT NULL,
+    product_code TEXT NOT NULL,
+    units INTEGER NOT NULL DEFAULT 0,
+    -- NOTE: revenue is multiple of 1 NOK
+    revenue INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (product_code, tick_no)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS orders_tick_sales_insert AFTER INSERT ON orders
+BEGIN
+    INSERT OR IGNORE INTO tick_sales ( tick_no, product_code )
+    VALUES ( NEW.tick_no, NEW.product_code );
+    UPDATE tick_sales SET
+        units = units + 1,
+        revenue = revenue + NEW.relative_cost + NEW.base_price
+    WHERE product_code = NEW.product_code AND tick_no = NEW.tick_no;
+END;
+
 -- table of ticks
--- price adjustments contain the adjustments relative to the product base price
 CREATE TABLE IF NOT EXISTS ticks (
     tick_no INTEGER PRIMARY KEY AUTOINCREMENT,
-    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')),
+    timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+
+-- ticks by time
+CREATE INDEX IF NOT EXISTS ticks_timestamp_idx ON ticks ( timestamp );
+
+-- table of price adjustments, one row per product for each tick
+-- adjustments are relative to the product base price
+CREATE TABLE IF NOT EXISTS tick_prices (
+    tick_no INTEGER NOT NULL REFERENCES ticks(tick_no),
+    product_code TEXT NOT NULL,
     -- NOTE: adjustments are stored in 1/100 NOK
-    price_adjustments BLOB NOT NULL
+    adjustment INTEGER NOT NULL,
+    PRIMARY KEY (product_code, tick_no)
+) WITHOUT ROWID;
+
+-- for reading all prices of the ticks after a given tick
+CREATE INDEX IF NOT EXISTS tick_prices_tick_idx ON tick_prices ( tick_no );
+
+-- running totals of all orders up to and including each tick
+-- maintained by triggers on ticks and orders, so the latest row gives the totals
+CREATE TABLE IF NOT EXISTS ledger (
+    tick_no INTEGER PRIMARY KEY REFERENCES ticks(tick_no),
+    -- NOTE: surplus is the sum of relative costs, the negated subsidy, multiple of 1 NOK
+    surplus INTEGER NOT NULL DEFAULT 0,
+    -- NOTE: revenue is multiple of 1 NOK
+    revenue INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0
 );
 
+CREATE TRIGGER IF NOT EXISTS ticks_ledger_insert AFTER INSERT ON ticks
+BEGIN
+    INSERT INTO ledger ( tick_no, surplus, revenue, units ) VALUES (
+        NEW.tick_no,
+        COALESCE(( SELECT surplus FROM ledger WHERE tick_no < NEW.tick_no ORDER BY tick_no DESC LIMIT 1 ), 0),
+        COALESCE(( SELECT revenue FROM ledger WHERE tick_no < NEW.tick_no ORDER BY tick_no DESC LIMIT 1 ), 0),
+        COALESCE(( SELECT units FROM ledger WHERE tick_no < NEW.tick_no ORDER BY tick_no DESC LIMIT 1 ), 0)
+    );
+END;
+
+CREATE TRIGGER IF NOT EXISTS orders_ledger_insert AFTER INSERT ON orders
+BEGIN
+    UPDATE ledger SET
+        surplus = surplus + NEW.relative_cost,
+        revenue = revenue + NEW.relative_cost + NEW.base_price,
+        units = units + 1
+    WHERE tick_no >= NEW.tick_no;
+END;
+
+-- generation counter, bumped by every change clients can see
+-- caches compare it to know when to reload
+INSERT OR IGNORE INTO config ( name, int_value ) VALUES ( 'GENERATION', 0 );
+
+CREATE TRIGGER IF NOT EXISTS config_generation_insert AFTER INSERT ON config
+WHEN NEW.name != 'GENERATION'
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS buyers_generation_insert AFTER INSERT ON buyers
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS buyers_generation_update AFTER UPDATE ON buyers
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_generation_insert AFTER INSERT ON products
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_generation_update AFTER UPDATE ON products
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS orders_generation_insert AFTER INSERT ON orders
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+CREATE TRIGGER IF NOT EXISTS ticks_generation_insert AFTER INSERT ON ticks
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'GENERATION';
+END;
+
+-- catalog counter, bumped by every change to the products
+-- together with the tick number it tells when the board must be rendered again
+INSERT OR IGNORE INTO config ( name, int_value ) VALUES ( 'CATALOG', 0 );
+
+CREATE TRIGGER IF NOT EXISTS products_catalog_insert AFTER INSERT ON products
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'CATALOG';
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_catalog_update AFTER UPDATE ON products
+BEGIN
+    UPDATE config SET int_value = int_value + 1 WHERE name = 'CATALOG';
+END;
+
+-- board snapshots rendered after each tick and served as stored bytes
+-- a snapshot is stale once the tick or the catalog differs from the one it was rendered at
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    catalog INTEGER NOT NULL,
+    tick_no INTEGER,
+    body BLOB NOT NULL,
+    body_gzip BLOB NOT NULL
+);
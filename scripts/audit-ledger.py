@@ -0,0 +1,32 @@
+import argparse
+
+from bearstock.stock import Exchange
+from bearstock.database import Database
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Verify the running order totals against a full recomputation.')
+    parser.add_argument('--fix', action='store_true', help='Rebuild the ledger if it is wrong.')
+
+    parsed = parser.parse_args()
+
+    db = Database(Exchange.DATABASE_FILE)
+    db.connect()
+
+    mismatches = db.audit_ledger()
+    for stored, expected in mismatches:
+        print(f'Ledger row {stored} should be {expected}')
+
+    if not mismatches:
+        totals = db.get_ledger_totals()
+        print(f'Ledger is correct at tick {totals["tick_no"]}: surplus {totals["surplus"]}, '
+              f'revenue {totals["revenue"]}, units {totals["units"]}')
+    elif parsed.fix:
+        db.rebuild_ledger()
+        print('Rebuilt the ledger')
+
+    db.close()
+
+    if mismatches and not parsed.fix:
+        raise SystemExit(1)
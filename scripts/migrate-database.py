@@ -0,0 +1,21 @@
+
+import argparse
+
+from bearstock.stock import Exchange
+from bearstock.database import Database
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema', type=str, default='schema.sql')
+    parsed = parser.parse_args()
+
+    db = Database(Exchange.DATABASE_FILE)
+    db.connect()
+
+    # create new tables before moving data into them
+    db.execute_script(open(parsed.schema).read())
+    db.migrate()
+    print(f'Migrated \'{Exchange.DATABASE_FILE}\' to the current schema')
+
+    db.close()
@@ -0,0 +1,17 @@
+
+from bearstock.stock import Exchange
+from bearstock.database import Database
+
+if __name__ == '__main__':
+
+    db = Database(Exchange.DATABASE_FILE)
+    db.connect()
+
+    db.rebuild_buyer_stats()
+    print('Rebuilt per buyer order statistics')
+    db.rebuild_tick_sales()
+    print('Rebuilt per tick product sales')
+    db.rebuild_ledger()
+    print('Rebuilt the ledger of running order totals')
+
+    db.close()
@@ -27,3 +27,7 @@ if __name__ == '__main__':
 
         db.close()
 
+        # so the change is seen right away
+        if not Exchange.wake():
+            print('No Exchange is running, it will see the change when started')
+
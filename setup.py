@@ -25,6 +25,7 @@ setup(
     ],
     tests_require=[
         'pytest == 2.8.2',
+        'Flask',
     ]
 
 )
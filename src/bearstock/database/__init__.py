@@ -1,15 +1,20 @@
 
 __all__ = [
-    'Database',
+    'Database', 'ConnectionPool', 'ConnectionProfile', 'RecentOrders', 'TickHistory',
     'Buyer', 'Order', 'Product',
+    'BuyerRow', 'OrderRow', 'ProductRow',
     'BearDatabaseError', 'BearModelError',
 ]
 
 from .errors import BearDatabaseError, BearModelError
 
 from .database import Database, BearDatabaseError
+from .history import TickHistory
+from .pool import ConnectionPool, ConnectionProfile
+from .recent import RecentOrders
 
 from .buyer import Buyer
 from .order import Order
 from .product import Product
+from .rows import BuyerRow, OrderRow, ProductRow
 
@@ -66,14 +66,18 @@ class Buyer(Model):
     def relative_cost_stats(self):
         return self._database.relative_cost_stats_for(self)
 
-    def as_dict(self) -> Dict[str, Any]:
+    def as_dict(self, *, with_last_order: bool = True) -> Dict[str, Any]:
         """Return the buyer as a dictionary.
 
         This method is for interoperability with the web server parts of BearStock.
-        The fields in the dictionary are: ``id``, ``name``, ``icon``, ``scaling``, and
-        ``created_at``.
+        The fields in the dictionary are: ``id``, ``name``, ``icon``, ``scaling``,
+        ``last_order_at``, and ``created_at``.
+
+        Args:
+            with_last_order: Look up ``last_order_at`` in the database. If False it is None.
+                Defaults to True.
         """
-        last_order = self.last_order
+        last_order = self.last_order if with_last_order else None
         return dict(
             id=self.uid,
             name=self.name,
@@ -1,19 +1,28 @@
-from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union,
+)
 
+import gzip
+import json
 import pickle
 import sqlite3
 from collections import namedtuple
+from contextlib import contextmanager
 from enum import Enum, auto
 
 from .errors import BearDatabaseError, BearModelError
 from .buyer import Buyer
+from .history import TickHistory
 from .model import Model
 from .order import Order
 from .parameters import Parameters
+from .pool import ConnectionPool, ConnectionProfile, open_connection
+from .recent import RecentOrders
+from .rows import BuyerRow, OrderRow, ProductRow
 from .product import Product
 
 __all__ = [
-    'Database', 'ConfigKeys',
+    'Database', 'ConfigKeys', 'ConfigSnapshot',
 ]
 
 # custom type descriptions
@@ -24,6 +33,29 @@ T = TypeVar('T')
 ProductPriceAdjustments = namedtuple(
     'ProductPriceAdjustments', ['timestamps', 'adjustments', 'prices', 'sales']
 )
+TickPrices = namedtuple(
+    'TickPrices', ['tick_no', 'timestamp', 'adjustments']
+)
+Snapshot = namedtuple(
+    'Snapshot', ['name', 'catalog', 'tick_no', 'body', 'body_gzip']
+)
+
+
+
+class CatalogEntry(namedtuple('CatalogEntry',
+                              ['product', 'price_adjustment', 'current_price', 'timeline'])):
+    __slots__ = ()
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the entry as ``Product.as_dict(with_derived=True)`` would, without
+        accessing the database.
+        """
+        return dict(
+            self.product.as_dict(),
+            current_price=self.current_price,
+            price_adjustment=self.price_adjustment,
+            timeline=self.timeline,
+        )
 
 
 class ConfigKeys(Enum):
@@ -32,6 +64,50 @@ class ConfigKeys(Enum):
     TICK_LENGTH = auto()
     TOTAL_TICKS = auto()
     QUARANTINE = auto()
+    GENERATION = auto()
+    CATALOG = auto()
+
+
+class ConfigSnapshot(NamedTuple):
+    """All application config values, loaded at once.
+
+    Attributes:
+        values: Mapping from config name (a `ConfigKeys` name) to integer value.
+    """
+    values: Dict[str, Optional[int]]
+
+    def get(self, key: ConfigKeys, default: Optional[int] = None) -> Optional[int]:
+        """Get the value for ``key``, or ``default`` if it is not set."""
+        value = self.values.get(key.name)
+        return value if value is not None else default
+
+    @property
+    def stock_running(self) -> bool:
+        return self.get(ConfigKeys.STOCK_RUNNING, 0) != 0
+
+    @property
+    def budget(self) -> Optional[int]:
+        return self.get(ConfigKeys.TOTAL_BUDGET)
+
+    @property
+    def tick_length(self) -> Optional[int]:
+        return self.get(ConfigKeys.TICK_LENGTH)
+
+    @property
+    def total_ticks(self) -> Optional[int]:
+        return self.get(ConfigKeys.TOTAL_TICKS)
+
+    @property
+    def quarantine(self) -> Optional[int]:
+        return self.get(ConfigKeys.QUARANTINE)
+
+    @property
+    def generation(self) -> int:
+        return self.get(ConfigKeys.GENERATION, 0)
+
+    @property
+    def catalog(self) -> int:
+        return self.get(ConfigKeys.CATALOG, 0)
 
 
 class Database:
@@ -39,11 +115,20 @@ class Database:
 
     Args:
         db_file: Pathname to the SQLite3 database file.
+        pool: Optional connection pool for ``db_file``. If given `connect` borrows a
+            long lived connection from the pool, and `close` returns it.
     """
 
-    def __init__(self, db_file: str) -> None:
+    def __init__(self, db_file: str, *, pool: Optional[ConnectionPool] = None) -> None:
+        if pool is not None and pool.dbname != db_file:
+            raise ValueError('connection pool is for another database file')
+
         self._db_file = db_file
+        self._pool = pool
         self._connection: Optional[sqlite3.Connection] = None
+        self._transaction_depth = 0
+        self._batch: Optional[Dict[Tuple[type, Any], Model]] = None
+        self._memo: Dict[str, Tuple[Tuple[int, int], Any]] = {}
 
     @property
     def dbname(self) -> str:
@@ -56,74 +141,434 @@ class Database:
             raise BearDatabaseError('database not open')
         return self._connection
 
+    @property
+    def tick_history(self) -> TickHistory:
+        """The process wide tick history of the database file, brought up to date.
+
+        Raises:
+            BearDatabaseError: If the database query failed.
+        """
+        history = TickHistory.for_file(self.dbname)
+        history.refresh(self, self.tick_number)
+        return history
+
     def is_connected(self) -> bool:
         return self._connection is not None
 
-    def connect(self) -> sqlite3.Connection:
-        """Connect to the database and do required initializations."""
+    def connect(self, *, profile: ConnectionProfile = ConnectionProfile.DEFAULT) -> sqlite3.Connection:
+        """Connect to the database and do required initializations.
+
+        Args:
+            profile: Connection tuning, see `ConnectionProfile`. Ignored when connections
+                come from a pool, as the pool configures its own connections.
+        """
         if self.is_connected():
             raise BearDatabaseError('database already open')
 
-        self._connection = sqlite3.connect(self.dbname)
-        self._connection.row_factory = sqlite3.Row
-        self._connection.execute('PRAGMA foreign_keys = ON')
+        self._memo.clear()
+        if self._pool is not None:
+            self._connection = self._pool.acquire()
+        else:
+            self._connection = open_connection(self.dbname, profile=profile)
+
+    def checkpoint(self, mode: str = 'PASSIVE') -> Tuple[int, int, int]:
+        """Copy committed transactions from the write-ahead log back into the database.
+
+        Only has an effect in WAL journal mode. A ``'PASSIVE'`` checkpoint never waits on
+        readers or writers, so it is safe to run while the web workers are serving.
+
+        Args:
+            mode: Checkpoint mode: ``'PASSIVE'``, ``'FULL'``, ``'RESTART'``, or
+                ``'TRUNCATE'``. Defaults to ``'PASSIVE'``.
+
+        Returns:
+            Tuple of: 1 if the checkpoint was blocked (else 0), pages in the log, and
+            pages checkpointed.
+
+        Raises:
+            BearDatabaseError: If the checkpoint failed.
+            ValueError: If ``mode`` is not a checkpoint mode.
+        """
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f'unknown checkpoint mode: {mode}')
+
+        def action(cursor: sqlite3.Cursor) -> Tuple[int, int, int]:
+            return tuple(cursor.fetchone())
+        return self.exe(f'PRAGMA wal_checkpoint({mode})', callable=action)
 
     def close(self) -> None:
-        """Close to the database connection."""
+        """Close to the database connection, or return it to the pool."""
         if not self.is_connected():
             raise RuntimeError('database already closed')
-        self._connection.close()
+
+        self._memo.clear()
+        connection, self._connection = self._connection, None
+        if self._pool is not None:
+            self._pool.release(connection)
+        else:
+            connection.close()
 
     def is_model_mine(self, model: Model) -> bool:
         return model.get_db() is self
 
     # generic DB access methods
 
+    @contextmanager
+    def transaction(self, *, immediate: bool = False) -> Iterator['Database']:
+        """Context manager running all database methods called inside it in one transaction.
+
+        The transaction is committed when the block exits, or rolled back if it raises.
+        Transactions nest: an inner transaction joins the outermost one, so nothing is
+        committed before the outermost block exits.
+
+        Example::
+
+            with db.transaction():
+                order = db.insert_order(...)
+                db.insert_order(...)
+
+        Args:
+            immediate: Take the write lock when the transaction begins instead of at the
+                first write. Use it for read-then-write transactions, so another writer
+                can not sneak in between. Defaults to False.
+
+        Raises:
+            BearDatabaseError: If the transaction could not begin or commit.
+        """
+        if self._transaction_depth > 0:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        connection = self.connection
+        try:
+            connection.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        except sqlite3.DatabaseError as e:
+            raise BearDatabaseError('could not begin transaction') from e
+
+        self._transaction_depth = 1
+        try:
+            yield self
+        except BaseException:
+            connection.rollback()
+            # a rollback changes neither part of the change stamp
+            self._memo.clear()
+            raise
+        else:
+            try:
+                connection.commit()
+            except sqlite3.DatabaseError as e:
+                connection.rollback()
+                self._memo.clear()
+                raise BearDatabaseError('could not commit transaction') from e
+        finally:
+            self._transaction_depth = 0
+
+    @contextmanager
+    def batch(self) -> Iterator['Database']:
+        """Context manager collecting product and buyer updates into one write.
+
+        Inside the block `update_product` and `update_buyer` (and so the product setters
+        and ``update_in_db``) only mark the model as dirty. When the block exits all dirty
+        models are written in one transaction. If the block raises nothing is written.
+        Nested batches join the outermost one.
+
+        Example::
+
+            with db.batch():
+                for product in db.get_all_products():
+                    product.base_price += 5
+
+        Raises:
+            BearDatabaseError: If writing the dirty models failed.
+        """
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = {}
+        try:
+            yield self
+        except BaseException:
+            self._batch = None
+            raise
+
+        dirty, self._batch = self._batch, None
+        products = [model for (kind, _), model in dirty.items() if kind is Product]
+        buyers = [model for (kind, _), model in dirty.items() if kind is Buyer]
+        with self.transaction():
+            if products:
+                self._write_products(products)
+            if buyers:
+                self._write_buyers(buyers)
+
+    def in_transaction(self) -> bool:
+        """Return True if inside a `transaction` block."""
+        return self._transaction_depth > 0
+
     def exe(self, sql: str, *,
             args: Optional[Union[DbArgs, List[DbArgs]]] = None, many: bool = False,
-            callable: Optional[Callable[[sqlite3.Cursor], T]] = None) -> Optional[T]:
+            callable: Optional[Callable[[sqlite3.Cursor], T]] = None,
+            plain_rows: bool = False) -> Optional[T]:
         """Execute a arbitrary database query.
 
+        The query runs in its own transaction, unless it is executed inside a
+        `transaction` block.
+
         Args:
             sql: SQL query.
             args: Optional arguments to the query. If ``many`` is False ``args`` should be
                 a single argument, when it is True is should be a list of arguments.
                 Defaults to None.
             many: If True ``args`` should contain a list of arguments, each of which ``sql``
-                should be executed with. All executions happen in the same transaction.
-                Defaults to False.
+                should be executed with. The statement is prepared once and all executions
+                happen in the same transaction. Defaults to False.
             callable: Optional action to perform on the cursor after the query have executed.
                 Defaults to None.
+            plain_rows: If True the cursor returns plain tuples instead of `sqlite3.Row`
+                instances, which is faster for large results. Defaults to False.
 
         Returns:
             If callable is not not return what returned by it; otherwise None.
         """
-        result: Optional[T] = None
-        try:
-            with self.connection:
-                cursor = self.connection.cursor()
-
+        def execute() -> Optional[T]:
+            cursor = self.connection.cursor()
+            if plain_rows:
+                cursor.row_factory = None
+            try:
                 if args is None:
                     cursor.execute(sql)
+                elif not many:
+                    cursor.execute(sql, args)
                 else:
-                    if not many:
-                        cursor.execute(sql, args)
-                    else:
-                        for arg in args:
-                            cursor.execute(sql, arg)
+                    cursor.executemany(sql, args)
 
                 # do something with the query result
                 if callable is not None:
-                    result = callable(cursor)
-
+                    return callable(cursor)
+                return None
+            finally:
                 cursor.close()
+
+        try:
+            if self.in_transaction():
+                return execute()
+            with self.connection:
+                return execute()
         except sqlite3.DatabaseError as e:
             raise BearDatabaseError('query failed') from e
 
-        return result
+    def execute_script(self, script: str) -> None:
+        """Execute a SQL script with several statements, eg. the contents of ``schema.sql``.
+
+        Note:
+            Any pending transaction is committed before the script runs.
+
+        Raises:
+            BearDatabaseError: If the script failed.
+            RuntimeError: If called inside a `transaction` block.
+        """
+        if self.in_transaction():
+            raise RuntimeError('cannot execute a script inside a transaction')
+        try:
+            self.connection.executescript(script)
+        except sqlite3.DatabaseError as e:
+            raise BearDatabaseError('script failed') from e
+
+    # change tracking methods
+
+    def _change_stamp(self) -> Tuple[int, int]:
+        """Get a stamp which changes whenever the database changes.
+
+        ``PRAGMA data_version`` changes when another connection commits, and the total
+        number of changes counts the writes done on this connection. Neither reads the
+        database, so this is much cheaper than any query.
+        """
+        try:
+            data_version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            raise BearDatabaseError('query failed') from e
+        return data_version, self.connection.total_changes
+
+    def memoize(self, key: str, compute: Callable[[], T]) -> T:
+        """Return the value memoized for ``key``, computing it with ``compute`` if the
+        database changed since it was memoized.
+
+        Values are memoized for as long as the database stays connected.
+
+        Raises:
+            BearDatabaseError: If the change check failed, or anything raised by ``compute``.
+        """
+        stamp = self._change_stamp()
+        memoized = self._memo.get(key)
+        if memoized is not None and memoized[0] == stamp:
+            return memoized[1]
+
+        value = compute()
+        self._memo[key] = (stamp, value)
+        return value
+
+    @property
+    def generation(self) -> int:
+        """Database generation counter.
+
+        The generation increases whenever ticks, orders, products, buyers, or config
+        change, from any process. Caches shared between connections can store the
+        generation with a value and reuse the value while it is unchanged.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        return self.config.generation
+
+    @property
+    def catalog(self) -> int:
+        """Catalog counter.
+
+        The catalog increases whenever a product is added or changed, from any process.
+        Together with the tick number it keys values derived from the products and their
+        prices, but not from the orders.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        return self.config.catalog
+
+    @property
+    def tick_number(self) -> int:
+        """Current tick number, memoized until the database changes.
+
+        Use this over `get_tick_number` when the tick number is read often, for instance
+        to key values which only change when a new tick is done.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        return self.memoize('tick_number', self.get_tick_number)
+
+    # schema methods
+
+    def migrate(self) -> None:
+        """Upgrade a database created from an older ``schema.sql`` in place.
+
+        The current schema must be applied before migrating, so all tables exists.
+        Every step checks if it is needed, so it is safe to migrate an up to date database.
+
+        Raises:
+            BearDatabaseError: If a migration step failed.
+        """
+        def columns(cursor: sqlite3.Cursor) -> List[str]:
+            return [row['name'] for row in cursor]
+
+        # first, as the triggers on orders read the column, and rebuilding the ticks table
+        # checks all triggers
+        if 'base_price' not in self.exe('PRAGMA table_info(orders)', callable=columns):
+            self._migrate_order_base_prices()
+
+        if 'price_adjustments' in self.exe('PRAGMA table_info(ticks)', callable=columns):
+            self._migrate_tick_prices()
+
+        def out_of_sync(cursor: sqlite3.Cursor) -> bool:
+            return bool(cursor.fetchone()[0])
+
+        # rollups of the orders table, and the column counting orders in each
+        rollups = [
+            ('buyer_stats', 'order_count', self.rebuild_buyer_stats),
+            ('tick_sales', 'units', self.rebuild_tick_sales),
+        ]
+        for table, count_column, rebuild in rollups:
+            if self.exe((f'SELECT ( SELECT COUNT(*) FROM orders ) '
+                         f'    != ( SELECT COALESCE(SUM({count_column}), 0) FROM {table} )'),
+                        callable=out_of_sync):
+                rebuild()
+
+        # the ledger needs a row per tick, the last one counting all orders
+        if self.exe(('SELECT ( SELECT COUNT(*) FROM ticks ) != ( SELECT COUNT(*) FROM ledger ) '
+                     '    OR ( SELECT COUNT(*) FROM orders ) != COALESCE(( '
+                     '        SELECT units FROM ledger WHERE tick_no = ( SELECT MAX(tick_no) FROM ledger ) '
+                     '    ), 0)'),
+                    callable=out_of_sync):
+            self.rebuild_ledger()
+
+    def _migrate_order_base_prices(self) -> None:
+        """Add the ``orders.base_price`` column, filled in with the current base prices
+        for the existing orders.
+        """
+        with self.transaction():
+            self.exe('ALTER TABLE orders ADD COLUMN base_price INTEGER NOT NULL DEFAULT 0')
+            self.exe(
+                'UPDATE orders SET base_price = ( '
+                '  SELECT base_price FROM products WHERE code = orders.product_code )')
+
+    def _migrate_tick_prices(self) -> None:
+        """Move the pickled ``ticks.price_adjustments`` blobs into ``tick_prices`` rows
+        and drop the blob column from ``ticks``.
+        """
+        def unpickle(cursor: sqlite3.Cursor) -> List[Tuple[int, str, int]]:
+            rows = []
+            for row in cursor:
+                for code, adj in pickle.loads(row['price_adjustments']).items():
+                    rows.append((row['tick_no'], code, adj))
+            return rows
+
+        def statements(cursor: sqlite3.Cursor) -> List[str]:
+            return [row['sql'] for row in cursor]
+
+        # orders and tick_prices reference ticks, so the rebuild must run without
+        # foreign key enforcement (which can only be toggled outside a transaction)
+        self.connection.execute('PRAGMA foreign_keys = OFF')
+        try:
+            with self.transaction():
+                # indexes and triggers are dropped with the table
+                recreate = self.exe((
+                    'SELECT sql FROM sqlite_master '
+                    "WHERE tbl_name = 'ticks' AND type IN ( 'index', 'trigger' ) AND sql IS NOT NULL"),
+                    callable=statements)
+
+                self.exe(
+                    'INSERT OR REPLACE INTO tick_prices ( tick_no, product_code, adjustment ) '
+                    'VALUES ( ?, ?, ? )',
+                    args=self.exe('SELECT tick_no, price_adjustments FROM ticks', callable=unpickle),
+                    many=True)
+
+                # sqlite cannot drop columns in older versions, so rebuild the table
+                self.exe(
+                    'CREATE TABLE ticks_migrated ( '
+                    '  tick_no INTEGER PRIMARY KEY AUTOINCREMENT, '
+                    "  timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')) "
+                    ')')
+                self.exe('INSERT INTO ticks_migrated ( tick_no, timestamp ) '
+                         'SELECT tick_no, timestamp FROM ticks')
+                self.exe('DROP TABLE ticks')
+                self.exe('ALTER TABLE ticks_migrated RENAME TO ticks')
+                for sql in recreate:
+                    self.exe(sql)
+        finally:
+            self.connection.execute('PRAGMA foreign_keys = ON')
+        TickHistory.forget(self.dbname)
 
     # config methods
 
+    @property
+    def config(self) -> ConfigSnapshot:
+        """All config values, loaded with a single query.
+
+        The snapshot is reused until the database changes, by this connection or any other.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> ConfigSnapshot:
+            return ConfigSnapshot(values={row['name']: row['int_value'] for row in cursor})
+
+        return self.memoize('config', lambda: self.exe(
+            'SELECT name, int_value FROM config',
+            callable=action
+        ))
+
     def set_config_stock_running(self, is_running: bool) -> None:
         self.exe(('INSERT OR REPLACE INTO config ( '
                   '  name, int_value '
@@ -132,12 +577,7 @@ class Database:
                        'running': 1 if is_running else 0})
 
     def get_config_stock_running(self) -> bool:
-        def action(cur: sqlite3.Cursor) -> bool:
-            row = cur.fetchone()
-            return row is not None and row['int_value'] != 0
-        return self.exe('SELECT int_value FROM config WHERE name LIKE :name',
-                        args={'name': ConfigKeys.STOCK_RUNNING.name},
-                        callable=action)
+        return self.config.stock_running
 
     def set_config_budget(self, budget: int) -> None:
         self.exe(('INSERT OR REPLACE INTO config ( '
@@ -147,11 +587,7 @@ class Database:
                        'budget': budget})
 
     def get_config_budget(self) -> int:
-        def action(cur: sqlite3.Cursor) -> int:
-            return cur.fetchone()['int_value']
-        return self.exe('SELECT int_value FROM config WHERE name LIKE :name',
-                        args={'name': ConfigKeys.TOTAL_BUDGET.name},
-                        callable=action)
+        return self.config.budget
 
     def set_config_tick_length(self, duration: int) -> None:
         self.exe(('INSERT OR REPLACE INTO config ( '
@@ -161,11 +597,7 @@ class Database:
                        'duration': duration})
 
     def get_config_tick_length(self) -> int:
-        def action(cur: sqlite3.Cursor) -> int:
-            return cur.fetchone()['int_value']
-        return self.exe('SELECT int_value FROM config WHERE name LIKE :name',
-                        args={'name': ConfigKeys.TICK_LENGTH.name},
-                        callable=action)
+        return self.config.tick_length
 
     def set_config_total_ticks(self, total: int) -> None:
         self.exe(('INSERT OR REPLACE INTO config ( '
@@ -175,11 +607,7 @@ class Database:
                        'total': total})
 
     def get_config_total_ticks(self) -> int:
-        def action(cur: sqlite3.Cursor) -> int:
-            return cur.fetchone()['int_value']
-        return self.exe('SELECT int_value FROM config WHERE name LIKE :name',
-                        args={'name': ConfigKeys.TOTAL_TICKS.name},
-                        callable=action)
+        return self.config.total_ticks
 
     def set_config_quarantine(self, time: int) -> None:
         self.exe(('INSERT OR REPLACE INTO config ( '
@@ -189,28 +617,25 @@ class Database:
                        'time': time})
 
     def get_config_quarantine(self) -> int:
-        def action(cur: sqlite3.Cursor) -> int:
-            return cur.fetchone()['int_value']
-        return self.exe('SELECT int_value FROM config WHERE name LIKE :name',
-                        args={'name': ConfigKeys.QUARANTINE.name},
-                        callable=action)
+        return self.config.quarantine
 
     # buyer related methods
 
     def insert_buyer(self, name: Optional[str], username: str, icon: str, *, scaling: float = 1.0) -> Buyer:
         def inserted_id(cursor: sqlite3.Cursor) -> int:
             return cursor.lastrowid
-        inserted_id = self.exe(
-                'INSERT INTO buyers ( name, username, icon, scaling ) VALUES ( :name, :username, :icon, :scaling )',
-            args={
-                'name': name,
-                'username': username,
-                'icon': icon,
-                'scaling': scaling,
-            },
-            callable=inserted_id
-        )
-        return self.get_buyer(inserted_id)
+        with self.transaction():
+            inserted_id = self.exe(
+                    'INSERT INTO buyers ( name, username, icon, scaling ) VALUES ( :name, :username, :icon, :scaling )',
+                args={
+                    'name': name,
+                    'username': username,
+                    'icon': icon,
+                    'scaling': scaling,
+                },
+                callable=inserted_id
+            )
+            return self.get_buyer(inserted_id)
 
     def update_buyer(self, buyer: Buyer) -> None:
         """Update the buyer stored in the database from a buyer model.
@@ -220,15 +645,24 @@ class Database:
         """
         if not self.is_model_mine(buyer):
             raise ValueError('buyer not bound to this database')
-        self.exe(
-            'UPDATE buyers SET name = :name, icon = :icon, scaling = :scaling WHERE id = :uid',
-            args={
+        if self._batch is not None:
+            self._batch[(Buyer, buyer.uid)] = buyer
+            return
+        self._write_buyers([buyer])
+
+    def _write_buyers(self, buyers: List[Buyer]) -> None:
+        self.exe((
+            'UPDATE buyers SET '
+            '  name = :name, username = :username, icon = :icon, scaling = :scaling '
+            'WHERE id = :uid'),
+            args=[{
                 'uid': buyer.uid,
                 'name': buyer.name,
                 'username': buyer.username,
                 'icon': buyer.icon,
                 'scaling': buyer.scaling,
-            }
+            } for buyer in buyers],
+            many=True
         )
 
     def get_buyer(self, uid: int) -> Optional[Buyer]:
@@ -291,7 +725,23 @@ class Database:
             callable=tolist
         )
 
-    def get_all_buyers(self) -> None:
+    def get_all_buyers(self, *, rows: bool = False) -> Union[List[Buyer], List[BuyerRow]]:
+        """Get all buyers ordered by username.
+
+        Args:
+            rows: If True return read only `BuyerRow` tuples instead of bound buyer models.
+                Defaults to False.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        if rows:
+            return self.exe(
+                f'SELECT {BuyerRow.COLUMNS} FROM buyers ORDER BY username ASC',
+                callable=lambda cursor: list(map(BuyerRow._make, cursor)),
+                plain_rows=True
+            )
+
         def action(cursor) -> List[Buyer]:
             buyers: List[Buyer] = []
             for row in cursor:
@@ -349,25 +799,22 @@ class Database:
                 and isinstance(hidden, bool)):
             raise ValueError('a product parameter has wrong type')
 
-        def action(cursor) -> int:
-            return cursor.lastrowid
-
-        pid = self.exe((
-            f'INSERT {"OR REPLACE" if replace_existing else ""} INTO products ( '
-            '  code, name, producer, base_price, quantity, type, tags, hidden '
-            ') VALUES ( '
-            '  :code, :name, :producer, :base_price, :quantity, :type, :tags, :hidden '
-            ')'),
-            args={
-                'code': code, 'name': name, 'producer': producer,
-                'type': type, 'tags': '|'.join(tags),
-                'base_price': base_price,
-                'quantity': quantity,
-                'hidden': hidden,
-            },
-            callable=action
-        )
-        return self.get_product(uid=pid)
+        with self.transaction():
+            self.exe((
+                f'INSERT {"OR REPLACE" if replace_existing else ""} INTO products ( '
+                '  code, name, producer, base_price, quantity, type, tags, hidden '
+                ') VALUES ( '
+                '  :code, :name, :producer, :base_price, :quantity, :type, :tags, :hidden '
+                ')'),
+                args={
+                    'code': code, 'name': name, 'producer': producer,
+                    'type': type, 'tags': '|'.join(tags),
+                    'base_price': base_price,
+                    'quantity': quantity,
+                    'hidden': hidden,
+                }
+            )
+            return self.get_product(code)
 
     def import_products(self,
                         products: Dict[str, Dict[str, Any]],
@@ -420,13 +867,19 @@ class Database:
             ValueError: If the product is not bound to this database.
         """
         if not self.is_model_mine(product):
-            raise ValueError('buyer not bound to this database')
+            raise ValueError('product not bound to this database')
+        if self._batch is not None:
+            self._batch[(Product, product.code)] = product
+            return
+        self._write_products([product])
+
+    def _write_products(self, products: List[Product]) -> None:
         self.exe((
             'UPDATE products SET '
             '  name = :name, producer = :producer, type = :type, '
             '  tags = :tags, base_price = :base_price, quantity = :quantity, hidden = :hidden '
             'WHERE code = :code'),
-            args={
+            args=[{
                 'code': product.code,
                 'name': product.name,
                 'producer': product.producer,
@@ -435,7 +888,8 @@ class Database:
                 'base_price': product.base_price,
                 'quantity': product.quantity,
                 'hidden': product.hidden,
-            }
+            } for product in products],
+            many=True
         )
 
     def get_product(self, code: str) -> Product:
@@ -469,14 +923,25 @@ class Database:
             callable=action
         )
 
-    def get_all_products(self, *, include_hidden: bool = True, bound=True) -> List[Product]:
+    def get_all_products(self, *, include_hidden: bool = True, bound=True,
+                         rows: bool = False) -> Union[List[Product], List[ProductRow]]:
         """Get all products from the database.
 
         Args:
             include_hidden: Include hidden products. Defaults to True.
             bound: If True bind the products to this database; else bind to nothing.
                 Defaults to True.
+            rows: If True return read only `ProductRow` tuples instead of product models.
+                Defaults to False.
         """
+        if rows:
+            return self.exe((
+                f'SELECT {ProductRow.COLUMNS} FROM products '
+                f'{"" if include_hidden else "WHERE NOT hidden"}'),
+                callable=lambda cursor: list(map(ProductRow.from_tuple, cursor)),
+                plain_rows=True
+            )
+
         def action(cursor) -> List[Product]:
             products: List[Product] = []
             for row in cursor:
@@ -532,21 +997,70 @@ class Database:
         def action(cursor: sqlite3.Cursor) -> int:
             return cursor.lastrowid
 
-        insered_id = self.exe((
-            f'INSERT INTO orders ( '
-            f'  buyer_id, product_code, relative_cost, tick_no{"" if created_at is None else ", created_at"} '
-            f') VALUES ( '
-            f'  :buyer, :product, :relative_cost, :tick_no{"" if created_at is None else ", :created_at"} '
-            f')'),
-            callable=action,
-            args={
-                'buyer': buyer.uid,
-                'product': product.code,
-                'relative_cost': relative_cost,
-                'tick_no': tick_no,
-                'created_at': created_at,
-            })
-        return self.get_order(insered_id)
+        with self.transaction():
+            insered_id = self.exe((
+                f'INSERT INTO orders ( '
+                f'  buyer_id, product_code, relative_cost, base_price, '
+                f'  tick_no{"" if created_at is None else ", created_at"} '
+                f') VALUES ( '
+                f'  :buyer, :product, :relative_cost, '
+                f'  ( SELECT base_price FROM products WHERE code = :product ), '
+                f'  :tick_no{"" if created_at is None else ", :created_at"} '
+                f')'),
+                callable=action,
+                args={
+                    'buyer': buyer.uid,
+                    'product': product.code,
+                    'relative_cost': relative_cost,
+                    'tick_no': tick_no,
+                    'created_at': created_at,
+                })
+            return self.get_order(insered_id)
+
+    def insert_order_at_current_price(self, buyer_id: int, product_code: str) -> Order:
+        """Insert a new order of a product at its current price.
+
+        The tick and price are resolved by the insert statement itself, from the last tick
+        in the database, so the order always lands in the tick it was priced at, even if a
+        tick is done concurrently.
+
+        Args:
+            buyer_id: Id of the buyer.
+            product_code: Code of the product bought.
+
+        Returns:
+            The inserted order model.
+
+        Raises:
+            BearDatabaseError: If the insert operation failed, for instance if there is
+                no buyer with ``buyer_id``.
+            ValueError: If there is no current price for the product.
+        """
+        return self.get_order(self._insert_at_current_price(buyer_id, product_code))
+
+    def _insert_at_current_price(self, buyer_id: int, product_code: str) -> int:
+        """Insert an order at the current price, see `insert_order_at_current_price`,
+        and return its id.
+        """
+        def action(cursor: sqlite3.Cursor) -> Optional[int]:
+            return cursor.lastrowid if cursor.rowcount == 1 else None
+
+        # the price is computed like Product.current_price
+        uid = self.exe((
+            'INSERT INTO orders ( buyer_id, product_code, relative_cost, base_price, tick_no ) '
+            'SELECT :buyer, products.code, '
+            '       py_round(products.base_price + tick_prices.adjustment/100.0) - products.base_price, '
+            '       products.base_price, tick_prices.tick_no '
+            'FROM tick_prices '
+            'JOIN products ON products.code = tick_prices.product_code '
+            'WHERE tick_prices.product_code = :code '
+            '  AND tick_prices.tick_no = ( SELECT MAX(tick_no) FROM ticks )'),
+            args={'buyer': buyer_id, 'code': product_code},
+            callable=action
+        )
+        if uid is None:
+            raise ValueError(f'no current price for product with code {product_code}')
+        return uid
 
     def import_orders(self, orders: List[Dict[str, Any]]) -> None:
         """Import orders into the database.
@@ -568,19 +1082,94 @@ class Database:
         args = []
         for order in orders:
             args.append({
-                'buyer': order['order_id'], 'product_id': product['product_id'],
+                'buyer': order['buyer'].uid, 'product': order['product'].code,
                 'relative_cost': order['relative_cost'],
-                'tick_no': order['tick_no'], 'created_at': order['created_at'],
+                'tick_no': order['tick_no'], 'created_at': order.get('created_at'),
             })
         self.exe((
             'INSERT INTO orders ( '
-            f'  buyer_id, product_code, relative_cost, tick_no{"" if created_at is None else ", created_at"} '
+            '  buyer_id, product_code, relative_cost, base_price, tick_no, created_at '
             ') VALUES ( '
-            f'  :buyer, :product, :relative_cost, tick_no{"" if created_at is None else ", :created_at"} '
+            '  :buyer, :product, :relative_cost, ( SELECT base_price FROM products WHERE code = :product ), '
+            "  :tick_no, COALESCE(:created_at, strftime('%s','now')) "
             ')'),
             args=args, many=True
         )
 
+    def insert_orders(self, orders: List[Dict[str, Any]]) -> List[Order]:
+        """Insert several new orders in one transaction, and return them.
+
+        Orders are supplied as mappings like for `import_orders`. Either all orders are
+        inserted, or none are.
+
+        Returns:
+            The inserted order models, in the order they were given.
+
+        Raises:
+            BearDatabaseError: If the insert operation failed.
+
+        See also `insert_order` for inserting a single order.
+        """
+        def action(cursor: sqlite3.Cursor) -> int:
+            return cursor.lastrowid
+
+        with self.transaction(immediate=True):
+            uids = []
+            for order in orders:
+                uids.append(self.exe((
+                    'INSERT INTO orders ( '
+                    '  buyer_id, product_code, relative_cost, base_price, tick_no, created_at '
+                    ') VALUES ( '
+                    '  :buyer, :product, :relative_cost, ( SELECT base_price FROM products WHERE code = :product ), '
+                    "  :tick_no, COALESCE(:created_at, strftime('%s','now')) "
+                    ')'),
+                    args={
+                        'buyer': order['buyer'].uid, 'product': order['product'].code,
+                        'relative_cost': order['relative_cost'],
+                        'tick_no': order['tick_no'], 'created_at': order.get('created_at'),
+                    },
+                    callable=action
+                ))
+            return self._inserted_orders(orders, uids)
+
+    def insert_orders_at_current_price(self, orders: List[Dict[str, Any]]) -> List[Order]:
+        """Insert several new orders at the current prices in one transaction, and return
+        them.
+
+        Orders are supplied as mappings with the keys ``buyer`` and ``product``. Each order
+        is priced like by `insert_order_at_current_price`, and either all orders are
+        inserted, or none are.
+
+        Returns:
+            The inserted order models, in the order they were given.
+
+        Raises:
+            BearDatabaseError: If the insert operation failed.
+            ValueError: If there is no current price for a product.
+        """
+        with self.transaction(immediate=True):
+            uids = [
+                self._insert_at_current_price(order['buyer'].uid, order['product'].code)
+                for order in orders
+            ]
+            return self._inserted_orders(orders, uids)
+
+    def _inserted_orders(self, orders: List[Dict[str, Any]], uids: List[int]) -> List[Order]:
+        """Build the models of orders just inserted with ids ``uids``, taking the buyers
+        and products from ``orders``. Must be called in the inserting transaction.
+        """
+        if not uids:
+            return []
+
+        # the write lock is held, so the ids are consecutive
+        rows = self.get_orders_since(uids[0] - 1, limit=len(uids))
+        return [
+            Order(uid=row.uid, buyer=order['buyer'], product=order['product'],
+                  relative_cost=row.relative_cost, tick_no=row.tick_no,
+                  created_at=row.created_at, database=self)
+            for order, row in zip(orders, rows)
+        ]
+
     def update_order(self, order: Order) -> None:
         """Update the order stored in the database.
         The order id  can not be changed.
@@ -639,20 +1228,32 @@ class Database:
             callable=action
         )
 
-    def get_all_orders(self, *, bound: bool = True) -> List[Order]:
+    def get_all_orders(self, *, bound: bool = True,
+                       rows: bool = False) -> Union[List[Order], List[OrderRow]]:
         """Get all orders stored in the database, ordered acsending (earliest orders first) by time.
 
         Args:
             bound: If True bind the order to this database; else bind to nothing.
                 Defaults to True.
+            rows: If True return read only `OrderRow` tuples instead of order models.
+                Loading rows needs no queries for the buyers and products of the orders,
+                so use it for exports and statistics over many orders. Defaults to False.
 
         Raises:
             BearDatabaseError: If the query failed.
         """
+        if rows:
+            return self.exe((
+                f'SELECT {OrderRow.COLUMNS} FROM orders '
+                'ORDER BY created_at ASC'),
+                callable=lambda cursor: list(map(OrderRow._make, cursor)),
+                plain_rows=True
+            )
+
         def action(cursor) -> List[Order]:
             order: List[Order] = []
             for row in cursor:
-                order.append(Buyer(
+                order.append(Order(
                     uid=row['id'],
                     buyer=self.get_buyer(row['buyer_id']),
                     product=self.get_product(row['product_code']),
@@ -706,6 +1307,30 @@ class Database:
             callable=action
         )
 
+    def get_recent_orders(self, count: int = 30, *,
+                          last_order_id: Optional[int] = None) -> List[OrderRow]:
+        """Get the ``count`` last orders as read only rows, ordered descending (newest
+        order first) by id.
+
+        The orders are served from the process wide `RecentOrders` buffer, which is only
+        brought up to date if there are new orders.
+
+        Args:
+            count: Number of orders to get, at most ``RecentOrders.SIZE``.
+            last_order_id: The largest order id, if already known, as given by
+                `get_last_order_id`. If it is up to date no query is needed.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+            ValueError: If ``count`` is negative or larger than the buffer.
+        """
+        recent = RecentOrders.for_file(self.dbname)
+        if not 0 <= count <= recent.size:
+            raise ValueError(f'can only get between 0 and {recent.size} recent orders')
+
+        recent.refresh(self, last_order_id)
+        return recent.latest(count)
+
     def get_orders_after(self, t: int,
                          *, exclusive: bool = True, bound: bool = True) -> List[Order]:
         """Get all orders made after time ``t``, ordered ascending (oldest first).
@@ -722,7 +1347,7 @@ class Database:
         def action(cursor) -> List[Order]:
             order: List[Order] = []
             for row in cursor:
-                order.append(Buyer(
+                order.append(Order(
                     uid=row['id'],
                     buyer=self.get_buyer(row['buyer_id']),
                     product=self.get_product(row['product_code']),
@@ -736,8 +1361,8 @@ class Database:
             'SELECT id, buyer_id, product_code, relative_cost, tick_no, created_at '
             'FROM orders '
             f'WHERE created_at {">" if exclusive else ">="} :time '
-            'ORDER BY created_at DESC'),
-            args={'count': count},
+            'ORDER BY created_at ASC'),
+            args={'time': t},
             callable=action
         )
 
@@ -757,7 +1382,7 @@ class Database:
         def action(cursor) -> List[Order]:
             order: List[Order] = []
             for row in cursor:
-                order.append(Buyer(
+                order.append(Order(
                     uid=row['id'],
                     buyer=self.get_buyer(row['buyer_id']),
                     product=self.get_product(row['product_code']),
@@ -771,11 +1396,33 @@ class Database:
             'SELECT id, buyer_id, product_code, relative_cost, tick_no, created_at '
             'FROM orders '
             f'WHERE created_at {"<" if exclusive else "<="} :time '
-            'ORDER BY created_at DESC'),
-            args={'count': count},
+            'ORDER BY created_at ASC'),
+            args={'time': t},
             callable=action
         )
 
+    def get_orders_since(self, order_id: int, *, limit: Optional[int] = None) -> List[OrderRow]:
+        """Get the orders with an id larger than ``order_id`` as read only rows, ordered
+        ascending by id. Order ids only increase, so the largest id seen by a client is a
+        cursor for the orders it is missing.
+
+        Args:
+            order_id: Id of the last order already seen.
+            limit: Maximum number of orders to get. Defaults to all.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        return self.exe((
+            f'SELECT {OrderRow.COLUMNS} FROM orders '
+            'WHERE id > :order_id '
+            'ORDER BY id ASC '
+            'LIMIT :limit'),
+            args={'order_id': order_id, 'limit': limit if limit is not None else -1},
+            callable=lambda cursor: list(map(OrderRow._make, cursor)),
+            plain_rows=True
+        )
+
     # XXX refactor to get_order_last_by_buyer
     def get_last_order_by(self, buyer: Buyer) -> Optional[Order]:
         def action(cursor) -> Optional[Order]:
@@ -798,23 +1445,118 @@ class Database:
             callable=action
         )
 
-    def relative_cost_stats_for(self, buyer: Buyer) -> Optional[Order]:
-        def action(cursor) -> Optional[Order]:
-            for row in cursor:
-                return {
-                    'sum': row['sum'] or 0,
-                    'count': row['count'] or 0
-                }
+    def relative_cost_stats_for(self, buyer: Buyer) -> Dict[str, int]:
+        """Get the sum of relative costs and the number of orders by ``buyer``.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor) -> Dict[str, int]:
+            row = cursor.fetchone()
+            return {
+                'sum': row['sum'] if row is not None else 0,
+                'count': row['count'] if row is not None else 0,
+            }
 
         return self.exe((
-            'SELECT sum(relative_cost) as sum, count(relative_cost) as count '
-            'FROM orders '
+            'SELECT relative_cost_sum AS sum, order_count AS count '
+            'FROM buyer_stats '
             'WHERE buyer_id = :uid'),
             args={'uid': buyer.uid},
             callable=action
-        )    # price methods
+        )
+
+    def get_all_buyer_cost_stats(self) -> Dict[int, Dict[str, Any]]:
+        """Get order statistics for every buyer in one query.
 
-    def do_tick(self, price_adjustments: Dict[str, Any], *, tick_no: Optional[int] = None) -> None:
+        Returns:
+            A dictionary mapping buyer id to a dictionary with the keys: ``sum`` (sum of
+            relative costs), ``count`` (number of orders), and ``last_order_at`` (timestamp
+            of the latest order or None).
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor) -> Dict[int, Dict[str, Any]]:
+            return {
+                row['id']: {
+                    'sum': row['sum'],
+                    'count': row['count'],
+                    'last_order_at': row['last_order_at'],
+                } for row in cursor
+            }
+
+        return self.exe((
+            'SELECT buyers.id, '
+            '  COALESCE(buyer_stats.relative_cost_sum, 0) AS sum, '
+            '  COALESCE(buyer_stats.order_count, 0) AS count, '
+            '  buyer_stats.last_order_at '
+            'FROM buyers '
+            'LEFT JOIN buyer_stats ON buyer_stats.buyer_id = buyers.id'),
+            callable=action
+        )
+
+    def rebuild_buyer_stats(self) -> None:
+        """Recompute the ``buyer_stats`` rollup from all orders.
+
+        Raises:
+            BearDatabaseError: If the queries failed.
+        """
+        with self.transaction():
+            self.exe('DELETE FROM buyer_stats')
+            self.exe((
+                'INSERT INTO buyer_stats ( '
+                '  buyer_id, relative_cost_sum, order_count, last_order_at, turnover '
+                ') SELECT orders.buyer_id, SUM(orders.relative_cost), COUNT(orders.id), '
+                '  MAX(orders.created_at), SUM(orders.relative_cost + orders.base_price) '
+                'FROM orders '
+                'GROUP BY orders.buyer_id'))
+
+    def get_leaderboard(self, count: int, *, best: bool = True) -> List[Dict[str, Any]]:
+        """Get the ``count`` buyers with the most (or least) profit.
+
+        Profit is what a buyer saved relative to the base prices of the products bought,
+        the negated sum of relative costs. Only buyers with orders are ranked. The
+        ranking is read from an index on the ``buyer_stats`` rollup, so the cost depends
+        on ``count``, not on the number of buyers or orders.
+
+        Args:
+            count: Number of buyers to get.
+            best: Get the buyers with the most profit first if True, else the buyers with
+                the least profit first. Defaults to True.
+
+        Returns:
+            A list of dictionaries with the keys: ``id``, ``name``, ``username``,
+            ``icon``, ``turnover``, ``profit``, and ``count`` (number of orders).
+
+        Raises:
+            BearDatabaseError: If the query failed.
+            ValueError: If ``count`` is negative.
+        """
+        if count < 0:
+            raise ValueError('cannot get a negative number of buyers')
+
+        def action(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+            return [dict(row) for row in cursor]
+
+        order = 'ASC' if best else 'DESC'
+        return self.exe((
+            'SELECT buyers.id, buyers.name, buyers.username, buyers.icon, '
+            '  buyer_stats.turnover, -buyer_stats.relative_cost_sum AS profit, '
+            '  buyer_stats.order_count AS count '
+            'FROM buyer_stats '
+            'JOIN buyers ON buyers.id = buyer_stats.buyer_id '
+            'WHERE buyer_stats.order_count > 0 '
+            f'ORDER BY buyer_stats.relative_cost_sum {order}, buyer_stats.buyer_id {order} '
+            'LIMIT :count'),
+            args={'count': count},
+            callable=action
+        )
+
+    # price methods
+
+    def do_tick(self, price_adjustments: Dict[str, Any], *,
+                tick_no: Optional[int] = None, timestamp: Optional[int] = None) -> None:
         """Insert a new set of price adjustments into the database and increment the ticks.
 
         Args:
@@ -822,20 +1564,25 @@ class Database:
                 *NB*: The unit is a multiple of ``1/100`` of a currency.
             tick_no: Use the number given as the next tick number. Only use this
                 if you know what you are doing.
+            timestamp: Time the tick was scheduled at. Defaults to the current time.
 
         Raises:
             BearDatabaseError: In the insert operation failed.
         """
-        self.exe((
-            'INSERT INTO ticks ( '
-            f'  {"tick_no," if tick_no is not None else ""} price_adjustments '
-            ') VALUES ( '
-            f'  {":tick_no," if tick_no is not None else ""} :blob '
-            ')'),
-            args={
-                'tick_no': tick_no,
-                'blob': sqlite3.Binary(pickle.dumps(price_adjustments)),
-            })
+        def inserted_tick(cursor: sqlite3.Cursor) -> int:
+            return cursor.lastrowid
+
+        with self.transaction():
+            # a NULL tick number is given the next number
+            inserted = self.exe((
+                'INSERT INTO ticks ( tick_no, timestamp ) '
+                "VALUES ( :tick_no, COALESCE(:timestamp, strftime('%s','now')) )"),
+                args={'tick_no': tick_no, 'timestamp': timestamp},
+                callable=inserted_tick)
+            self.exe(
+                'INSERT INTO tick_prices ( tick_no, product_code, adjustment ) VALUES ( ?, ?, ? )',
+                args=[(inserted, code, adj) for code, adj in price_adjustments.items()],
+                many=True)
 
     def get_product_price_adjustment(self, code: str) -> int:
         """Get the price adjustment for product with code ``code``.
@@ -847,17 +1594,19 @@ class Database:
         if not isinstance(code, str):
             raise ValueError('code is not a string')
 
-        def action(cursor: sqlite3.Cursor) -> Dict[str, Any]:
+        def action(cursor: sqlite3.Cursor) -> Optional[int]:
             row = cursor.fetchone()
-            return pickle.loads(row['price_adjustments'])
+            return row['adjustment'] if row is not None else None
 
-        adjustments = self.exe(
-            'SELECT tick_no, price_adjustments FROM ticks ORDER BY tick_no DESC LIMIT 1',
+        adjustment = self.exe((
+            'SELECT adjustment FROM tick_prices '
+            'WHERE product_code = :code AND tick_no = ( SELECT MAX(tick_no) FROM ticks )'),
+            args={'code': code},
             callable=action
         )
 
-        if code in adjustments:
-            return adjustments[code]
+        if adjustment is not None:
+            return adjustment
         raise ValueError(f'no product with code {code} in database prices')
 
     def get_product_historic_prices(self, product: Union[str, Product]) -> ProductPriceAdjustments:
@@ -867,41 +1616,27 @@ class Database:
             product: Either a string product code, or a actual product.
 
         Returns:
-            A namedtuple with three elements: ``timestamps``, ``adjustments``, and ``prices``.
+            A namedtuple with four elements: ``timestamps``, ``adjustments``, ``prices``,
+            and ``sales``.
 
         Raises:
             BearDatabaseError: If the database query failed.
             ValueError: If no product with ``code`` exists.
         """
         if isinstance(product, str):
-            product = self.get_product(code)
+            product = self.get_product(product)
         elif isinstance(product, Product):
             if not product.is_bound():
-                product = self.get_product(code)
+                product = self.get_product(product.code)
         else:
             raise ValueError('product not a product or product code')
 
-        code, base_price = product.code, product.base_price
-        sales = self.get_product_sold_per_tick(product)
-
-        def action(cursor: sqlite3.Cursor) -> ProductPriceAdjustments:
-            timestamps = []
-            adjustments = []
-            prices = []
-            for row in cursor:
-                adj = pickle.loads(row['price_adjustments'])
-
-                timestamps.append(row['timestamp'])
-                adjustments.append(adj[code])
-                prices.append(int(round(base_price + adj[code]/100)))
-
-            return ProductPriceAdjustments(
-                timestamps=timestamps, adjustments=adjustments, prices=prices, sales=sales
-            )
+        timestamps, adjustments, prices = self.tick_history.get_product(
+            product.code, product.base_price)
 
-        return self.exe(
-            'SELECT price_adjustments, timestamp FROM ticks',
-            callable=action
+        return ProductPriceAdjustments(
+            timestamps=timestamps, adjustments=adjustments, prices=prices,
+            sales=self.get_product_sold_per_tick(product),
         )
 
     def get_all_product_historic_prices(self, *, include_hidden: bool = True
@@ -912,40 +1647,137 @@ class Database:
             include_hidden: Include hidden products.
 
         Returns:
-            A dictionary mapping from product code to a namedtuple with three elements:
-                ``timestamps``, ``adjustments``, and ``prices``.
+            A dictionary mapping from product code to a namedtuple with four elements:
+                ``timestamps``, ``adjustments``, ``prices``, and ``sales``.
 
         Raises:
             BearDatabaseError: If the database query failed.
         """
         base_prices = {
             product.code: product.base_price
-                for product in self.get_all_products() if (hidden or product.hidden)
+                for product in self.get_all_products(include_hidden=include_hidden)
         }
+        return self._get_historic_prices(base_prices)
 
-        sales = self.get_all_products_sold_per_tick()
+    def _get_historic_prices(self, base_prices: Dict[str, int]
+                             ) -> Dict[str, ProductPriceAdjustments]:
+        """Get historic prices for the products in ``base_prices``, a mapping from product
+        code to product base price. Always runs the same number of queries.
+        """
+        history = self.tick_history
+        sales = self.get_all_products_sold_per_tick(base_prices)
+
+        products: Dict[str, ProductPriceAdjustments] = {}
+        for code, base_price in base_prices.items():
+            timestamps, adjustments, prices = history.get_product(code, base_price)
+            products[code] = ProductPriceAdjustments(
+                timestamps=timestamps, adjustments=adjustments, prices=prices, sales=sales[code]
+            )
+        return products
 
-        def action(cursor: sqlite3.Cursor) -> Dict[str, ProductPriceAdjustments]:
-            products = {
-                code: ProductPriceAdjustments for code in base_prices
-            }
-            for row in cursor:
-                adj = pickle.loads(row['price_adjustments'])
+    def get_catalog_snapshot(self, *, include_hidden: bool = False) -> List[CatalogEntry]:
+        """Get all products together with their derived fields.
 
-                for code in adj:
-                    products[code].timestamps.append(row['timestamp'])
-                    products[code].adjustments.append(adj[code])
-                    products[code].prices.append(int(round(base_prices[code] + adj[code]/100)))
+        This gives the same values as ``Product.as_dict(with_derived=True)`` for every
+        product, but with a fixed number of database queries regardless of the number of
+        products.
 
-                for code in adj:
-                    products[code].sales = sales[code]
+        Args:
+            include_hidden: Include hidden products. Defaults to False.
 
-            return products
+        Returns:
+            A list of namedtuples with four elements: ``product``, ``price_adjustment``,
+            ``current_price``, and ``timeline``.
 
-        return self.exe(
-            'SELECT price_adjustments, timestamp FROM ticks',
-            callable=action
+        Raises:
+            BearDatabaseError: If the database queries failed.
+        """
+        products = self.get_all_products(include_hidden=include_hidden)
+        timelines = self._get_historic_prices({
+            product.code: product.base_price for product in products
+        })
+
+        catalog: List[CatalogEntry] = []
+        for product in products:
+            timeline = timelines[product.code]
+            adjustment = timeline.adjustments[-1] if timeline.adjustments else 0
+            catalog.append(CatalogEntry(
+                product=product,
+                price_adjustment=adjustment,
+                current_price=int(round(product.base_price + adjustment/100)),
+                timeline=timeline,
+            ))
+        return catalog
+
+    def get_board_snapshot(self, *, include_hidden: bool = False) -> Snapshot:
+        """Get the stored board snapshot, rendering it anew if it is stale.
+
+        The board is the JSON document ``{"products": [...]}`` with the products as
+        given by `get_catalog_snapshot`, except that the sales of the current tick are
+        left at zero. They change with every order, so clients get them from
+        `get_tick_sales` instead. The Exchange publishes the board after each tick, and
+        it only goes stale when a product changes, in which case the first reader
+        renders and stores it again. Orders never make it stale.
+
+        Args:
+            include_hidden: Include hidden products. Defaults to False.
+
+        Returns:
+            A namedtuple with five elements: ``name``, ``catalog``, ``tick_no``,
+            ``body`` (UTF-8 JSON bytes), and ``body_gzip`` (the body gzip compressed).
+
+        Raises:
+            BearDatabaseError: If the database queries failed.
+        """
+        name = 'board-hidden' if include_hidden else 'board'
+
+        def action(cursor: sqlite3.Cursor) -> Optional[Snapshot]:
+            row = cursor.fetchone()
+            return Snapshot._make(row) if row is not None else None
+        snapshot = self.exe((
+            'SELECT name, catalog, tick_no, body, body_gzip FROM snapshots '
+            'WHERE name = :name '
+            '  AND tick_no = ( SELECT MAX(tick_no) FROM ticks ) '
+            "  AND catalog = ( SELECT int_value FROM config WHERE name = 'CATALOG' )"),
+            args={'name': name},
+            callable=action,
+            plain_rows=True
         )
+        if snapshot is not None:
+            return snapshot
+        return self.publish_board_snapshot(include_hidden=include_hidden)
+
+    def publish_board_snapshot(self, *, include_hidden: bool = False) -> Snapshot:
+        """Render the board snapshot and store it, replacing the previous one.
+
+        See `get_board_snapshot` for the contents.
+
+        Raises:
+            BearDatabaseError: If the database queries failed.
+        """
+        # render from one consistent read, so the snapshot matches its key
+        with self.transaction():
+            catalog = self.catalog
+            tick_no = self.get_tick_number()
+            products = []
+            for entry in self.get_catalog_snapshot(include_hidden=include_hidden):
+                entry.timeline.sales[tick_no] = 0  # see get_tick_sales
+                products.append(entry.as_dict())
+
+        body = json.dumps({'products': products}).encode('utf-8')
+        snapshot = Snapshot(
+            name='board-hidden' if include_hidden else 'board',
+            catalog=catalog,
+            tick_no=tick_no,
+            body=body,
+            body_gzip=gzip.compress(body),
+        )
+        self.exe((
+            'INSERT OR REPLACE INTO snapshots ( name, catalog, tick_no, body, body_gzip ) '
+            'VALUES ( :name, :catalog, :tick_no, :body, :body_gzip )'),
+            args=snapshot._asdict()
+        )
+        return snapshot
 
     def get_product_sold_per_tick(self, product: Union[str, Product]) -> List[int]:
         """Get the number of products with ``code`` sold at each tick.
@@ -972,36 +1804,117 @@ class Database:
                 per_tick[row['tick_no']] = row['sold']
             return per_tick
 
+        # bounded, as a tick may be done after the tick number was read
         return self.exe(
-            ('SELECT tick_no, count(id) AS sold FROM orders '
-             'WHERE product_code LIKE :code '
-             'GROUP BY tick_no '
-             'ORDER BY tick_no ASC'),
-            args={'code': product.code},
+            ('SELECT tick_no, units AS sold FROM tick_sales '
+             'WHERE product_code = :code AND tick_no < :ticks'),
+            args={'code': product.code, 'ticks': ticks},
             callable=action,
         )
 
-    def get_all_products_sold_per_tick(self) -> Dict[str, List[int]]:
+    def get_all_products_sold_per_tick(self, codes: Iterable[str] = ()) -> Dict[str, List[int]]:
         """Get a dictionary mapping product code to a list of products sold at each tick.
 
+        Args:
+            codes: Product codes to include even if they have no orders.
+
         Raises:
             BearDatabaseError: If the database queries failed.
         """
-        ticks = self.get_tick_number()
+        ticks = self.get_tick_number() + 1
         def action(cursor: sqlite3.Cursor) -> Dict[str, List[int]]:
-            products: Dict[str, List[int]] = {}
+            products: Dict[str, List[int]] = {code: [0]*ticks for code in codes}
             for row in cursor:
                 code = row['product_code']
                 if code not in products:
                     products[code] = [0]*ticks
-                products[code][row['tick_no']] = row['count']
+                products[code][row['tick_no']] = row['sold']
             return products
 
+        # bounded, as a tick may be done after the tick number was read
+        return self.exe(
+            'SELECT tick_no, product_code, units AS sold FROM tick_sales WHERE tick_no < :ticks',
+            args={'ticks': ticks},
+            callable=action,
+        )
+
+    def get_tick_sales(self, tick_no: int) -> Dict[str, int]:
+        """Get a dictionary mapping product code to the number of products sold at tick
+        ``tick_no``. Products without sales are left out.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        # one primary key lookup per product, instead of a scan of all ticks
+        return self.exe((
+            'SELECT product_code, units FROM tick_sales '
+            'WHERE product_code IN ( SELECT code FROM products ) AND tick_no = :tick_no'),
+            args={'tick_no': tick_no},
+            callable=lambda cursor: {code: units for code, units in cursor},
+            plain_rows=True
+        )
+
+    def rebuild_tick_sales(self) -> None:
+        """Recompute the ``tick_sales`` rollup from all orders.
+
+        Revenue is recomputed with the base prices stored on the orders.
+
+        Raises:
+            BearDatabaseError: If the queries failed.
+        """
+        with self.transaction():
+            self.exe('DELETE FROM tick_sales')
+            self.exe((
+                'INSERT INTO tick_sales ( tick_no, product_code, units, revenue ) '
+                'SELECT orders.tick_no, orders.product_code, COUNT(orders.id), '
+                '  SUM(orders.relative_cost + orders.base_price) '
+                'FROM orders '
+                'GROUP BY orders.product_code, orders.tick_no'))
+
+    def get_last_order_id(self) -> int:
+        """Get the id of the last order, or 0 if there are no orders.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
         return self.exe(
-            ('SELECT tick_no, product_code, count(id) AS sold FROM orders '
-             'GROUP BY tick_no, product_code '
-             'ORDER BY tick_no ASC'),
+            'SELECT COALESCE(MAX(id), 0) FROM orders',
+            callable=lambda cursor: cursor.fetchone()[0]
+        )
+
+    def get_ticks_since(self, tick_no: int, *, limit: Optional[int] = None) -> List[TickPrices]:
+        """Get the ticks with a number larger than ``tick_no``, ordered ascending.
+
+        Args:
+            tick_no: Number of the last tick already seen.
+            limit: Maximum number of ticks to get. Defaults to all.
+
+        Returns:
+            A list of namedtuples with three elements: ``tick_no``, ``timestamp``, and
+            ``adjustments``, a dictionary from product code to price adjustment.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> List[TickPrices]:
+            ticks: List[TickPrices] = []
+            for tick, timestamp, code, adjustment in cursor:
+                if not ticks or ticks[-1].tick_no != tick:
+                    ticks.append(TickPrices(tick_no=tick, timestamp=timestamp, adjustments={}))
+                if code is not None:
+                    ticks[-1].adjustments[code] = adjustment
+            return ticks
+        return self.exe((
+            'SELECT ticks.tick_no, ticks.timestamp, tick_prices.product_code, tick_prices.adjustment '
+            'FROM ticks '
+            'LEFT JOIN tick_prices ON tick_prices.tick_no = ticks.tick_no '
+            'WHERE ticks.tick_no IN ( '
+            '  SELECT tick_no FROM ticks WHERE tick_no > :tick_no ORDER BY tick_no ASC LIMIT :limit '
+            ') '
+            'ORDER BY ticks.tick_no ASC'),
+            args={'tick_no': tick_no, 'limit': limit if limit is not None else -1},
             callable=action,
+            plain_rows=True
         )
 
     # various methods
@@ -1014,7 +1927,7 @@ class Database:
         def action(cursor: sqlite3.Cursor) -> int:
             return cursor.fetchone()['tick_no']
         return self.exe(
-            'SELECT tick_no FROM ticks ORDER BY tick_no DESC LIMIT 1',
+            'SELECT MAX(tick_no) AS tick_no FROM ticks',
             callable=action
         )
 
@@ -1027,15 +1940,132 @@ class Database:
         def action(cursor: sqlite3.Cursor) -> int:
             return cursor.fetchone()['timestamp']
         return self.exe(
-            'SELECT timestamp FROM ticks ORDER BY timestamp DESC LIMIT 1',
+            'SELECT MAX(timestamp) AS timestamp FROM ticks',
+            callable=action
+        )
+
+    def get_version_token(self) -> str:
+        """Get a token which changes whenever the data served to clients may change.
+
+        The token is made from the last tick number, the largest order id, and the
+        database generation, read in a single query, so it is cheap enough to check
+        on every request before loading anything else.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> str:
+            tick_no, order_id, generation = cursor.fetchone()
+            return f'{tick_no}-{order_id}-{generation}'
+        return self.exe((
+            'SELECT ( SELECT MAX(tick_no) FROM ticks ), '
+            '       ( SELECT MAX(id) FROM orders ), '
+            "       ( SELECT int_value FROM config WHERE name = 'GENERATION' )"),
             callable=action
         )
 
     def get_purchase_surplus(self) -> int:
-       """Get the total surplus from orders relative to product base prices."""
-       def action(cur: sqlite3.Cursor) -> int:
-           return cur.fetchone()[0] or 0
-       return self.exe('SELECT SUM(relative_cost) FROM orders', callable=action)
+        """Get the total surplus from orders relative to product base prices.
+
+        The total is read from the latest ``ledger`` row.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        return self.get_ledger_totals()['surplus']
+
+    def get_ledger_totals(self) -> Dict[str, int]:
+        """Get the running order totals as of the latest tick.
+
+        Returns:
+            A dictionary with the keys: ``tick_no``, ``surplus`` (sum of relative costs),
+            ``subsidy`` (the negated surplus), ``revenue``, and ``units``. The values are
+            zero (and ``tick_no`` None) if there are no ticks.
+
+        Raises:
+            BearDatabaseError: If the query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> Dict[str, int]:
+            row = cursor.fetchone()
+            if row is None:
+                return {'tick_no': None, 'surplus': 0, 'subsidy': 0, 'revenue': 0, 'units': 0}
+            return {
+                'tick_no': row['tick_no'],
+                'surplus': row['surplus'],
+                'subsidy': -row['surplus'],
+                'revenue': row['revenue'],
+                'units': row['units'],
+            }
+        return self.exe((
+            'SELECT tick_no, surplus, revenue, units FROM ledger '
+            'WHERE tick_no = ( SELECT MAX(tick_no) FROM ledger )'),
+            callable=action
+        )
+
+    def _compute_ledger(self) -> List[Tuple[int, int, int, int]]:
+        """Compute the ``ledger`` rows from scratch.
+
+        Surplus, revenue and units are all summed from the orders, with revenue from the
+        base price stored on each order.
+        """
+        def per_tick(cursor: sqlite3.Cursor) -> Dict[int, Tuple[int, int, int]]:
+            return {tick_no: (surplus, revenue, units) for tick_no, surplus, revenue, units in cursor}
+
+        orders = self.exe((
+            'SELECT tick_no, SUM(relative_cost), SUM(relative_cost + base_price), COUNT(id) '
+            'FROM orders GROUP BY tick_no'),
+            callable=per_tick, plain_rows=True)
+        ticks = self.exe(
+            'SELECT tick_no FROM ticks ORDER BY tick_no ASC',
+            callable=lambda cursor: [row[0] for row in cursor], plain_rows=True)
+
+        rows = []
+        total_surplus = total_revenue = total_units = 0
+        for tick_no in ticks:
+            surplus, revenue, units = orders.get(tick_no, (0, 0, 0))
+            total_surplus += surplus
+            total_revenue += revenue
+            total_units += units
+            rows.append((tick_no, total_surplus, total_revenue, total_units))
+        return rows
+
+    def rebuild_ledger(self) -> None:
+        """Recompute the ``ledger`` running totals.
+
+        Raises:
+            BearDatabaseError: If the queries failed.
+        """
+        with self.transaction():
+            rows = self._compute_ledger()
+            self.exe('DELETE FROM ledger')
+            self.exe(
+                'INSERT INTO ledger ( tick_no, surplus, revenue, units ) VALUES ( ?, ?, ?, ? )',
+                args=rows, many=True)
+
+    def audit_ledger(self) -> List[Tuple[Optional[Tuple[int, int, int, int]],
+                                         Optional[Tuple[int, int, int, int]]]]:
+        """Compare the ``ledger`` with a full recomputation.
+
+        Returns:
+            The mismatching rows as pairs of the stored and the recomputed
+            ``(tick_no, surplus, revenue, units)`` rows, with None for a missing row.
+            An empty list means the ledger is correct.
+
+        Raises:
+            BearDatabaseError: If the queries failed.
+        """
+        with self.transaction():
+            expected = {row[0]: row for row in self._compute_ledger()}
+            stored = self.exe(
+                'SELECT tick_no, surplus, revenue, units FROM ledger',
+                callable=lambda cursor: {row[0]: tuple(row) for row in cursor},
+                plain_rows=True)
+
+        return [
+            (stored.get(tick_no), expected.get(tick_no))
+            for tick_no in sorted(set(stored) | set(expected))
+            if stored.get(tick_no) != expected.get(tick_no)
+        ]
 
     # parameters methods
 
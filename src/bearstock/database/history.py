@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Tuple
+
+import os
+import sqlite3
+import threading
+from array import array
+
+__all__ = [
+    'TickHistory',
+]
+
+
+class _ProductHistory:
+    """Price history columns for a single product."""
+
+    __slots__ = ('timestamps', 'adjustments', 'prices', 'base_price')
+
+    def __init__(self) -> None:
+        self.timestamps = array('q')
+        self.adjustments = array('q')
+        self.prices = array('q')
+        self.base_price: Optional[int] = None
+
+
+class TickHistory:
+    """Process wide, append-only copy of the tick price history of a database file.
+
+    Ticks are only ever appended by `Database.do_tick`, so the history is brought up to
+    date by loading the ticks with a number larger than the last tick seen. If the
+    database has fewer ticks than seen, the ticks were rewritten and the history is
+    loaded again from the start. Use
+    `for_file` to get the shared instance for a database file, and `Database.tick_history`
+    to get one which is up to date.
+
+    Note:
+        Instances are thread safe.
+    """
+
+    _instances: Dict[str, 'TickHistory'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._last_tick: Optional[int] = None
+        self._products: Dict[str, _ProductHistory] = {}
+
+    @classmethod
+    def for_file(cls, db_file: str) -> 'TickHistory':
+        """Get the history shared by all databases connected to ``db_file``."""
+        key = os.path.abspath(db_file)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls()
+            return cls._instances[key]
+
+    @classmethod
+    def forget(cls, db_file: str) -> None:
+        """Drop the shared history for ``db_file``. Needed if the ticks are rewritten."""
+        with cls._instances_lock:
+            cls._instances.pop(os.path.abspath(db_file), None)
+
+    @property
+    def last_tick(self) -> Optional[int]:
+        """Number of the last tick loaded, or None if no ticks are loaded."""
+        return self._last_tick
+
+    def refresh(self, db: 'Database', last_tick: Optional[int] = None) -> None:
+        """Load ticks newer than the last tick seen from ``db``.
+
+        Args:
+            db: Database to load from.
+            last_tick: The largest tick number in the database, if already known.
+                If it is the last tick seen nothing is loaded.
+
+        Raises:
+            BearDatabaseError: If the database query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> None:
+            for tick_no, timestamp, code, adjustment in cursor:
+                self._last_tick = tick_no
+                if code is None:
+                    continue  # tick without any prices
+
+                product = self._products.get(code)
+                if product is None:
+                    product = self._products[code] = _ProductHistory()
+                product.timestamps.append(timestamp)
+                product.adjustments.append(adjustment)
+                if product.base_price is not None:
+                    product.prices.append(int(round(product.base_price + adjustment/100)))
+
+        with self._lock:
+            if last_tick is None:
+                last_tick = db.get_tick_number()
+            if self._last_tick is not None:
+                if last_tick == self._last_tick:
+                    return
+                if last_tick is None or last_tick < self._last_tick:
+                    # the ticks were rewritten, start over
+                    self._products.clear()
+                    self._last_tick = None
+
+            db.exe((
+                'SELECT ticks.tick_no, ticks.timestamp, tick_prices.product_code, tick_prices.adjustment '
+                'FROM ticks '
+                'LEFT JOIN tick_prices ON tick_prices.tick_no = ticks.tick_no '
+                'WHERE ticks.tick_no > :last '
+                'ORDER BY ticks.tick_no ASC'),
+                args={'last': self._last_tick if self._last_tick is not None else -1},
+                callable=action
+            )
+
+    def get_product(self, code: str, base_price: int) -> Tuple[List[int], List[int], List[int]]:
+        """Get the timestamps, adjustments and prices of the product with code ``code``.
+
+        Prices are computed relative to ``base_price`` and kept until the base price changes.
+        """
+        with self._lock:
+            product = self._products.get(code)
+            if product is None:
+                return [], [], []
+
+            if product.base_price != base_price:
+                product.base_price = base_price
+                product.prices = array('q', (
+                    int(round(base_price + adjustment/100)) for adjustment in product.adjustments
+                ))
+
+            return (product.timestamps.tolist(),
+                    product.adjustments.tolist(),
+                    product.prices.tolist())
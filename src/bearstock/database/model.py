@@ -1,11 +1,14 @@
 
-from typing import Optional
+from typing import Iterator, Optional
 from abc import ABC
+from contextlib import contextmanager
 
 
 class Model(ABC):
     def __init__(self, *, database: Optional['Database'] = None):
         self._database = database
+        self._deferred = 0
+        self._dirty = False
 
     def get_db(self) -> 'Database':
         """Get the model database, or None if no database is registered."""
@@ -19,3 +22,37 @@ class Model(ABC):
         """Return True if the model is connected to a database."""
         return self._database is not None and self._database.is_connected()
 
+    @contextmanager
+    def deferred(self) -> Iterator['Model']:
+        """Context manager deferring the writes done by property setters.
+
+        Changes made inside the block are written with a single ``update_in_db`` when the
+        outermost block exits. If the block raises nothing is written.
+
+        Example::
+
+            with product.deferred():
+                product.name = 'Pale Ale'
+                product.base_price = 40
+        """
+        self._deferred += 1
+        try:
+            yield self
+        except BaseException:
+            self._dirty = False
+            raise
+        finally:
+            self._deferred -= 1
+
+        if self._deferred == 0 and self._dirty:
+            self._dirty = False
+            self.update_in_db()
+
+    def _changed(self) -> None:
+        """Called by setters to write the model to its database, unless writes are deferred."""
+        if not self.is_bound():
+            return
+        if self._deferred > 0:
+            self._dirty = True
+        else:
+            self.update_in_db()
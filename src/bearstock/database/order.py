@@ -3,6 +3,7 @@ from typing import Any, Dict, Optional
 
 from .errors import BearDatabaseError, BearModelError
 from .model import Model
+from .rows import OrderRow
 
 
 class Order(Model):
@@ -105,6 +106,11 @@ class Order(Model):
             price=None if not with_derived else (product.base_price + self.relative_cost),
         )
 
+    def as_row(self) -> OrderRow:
+        """Return the order as a read only `OrderRow`."""
+        return OrderRow(self._uid, self._buyer_id, self._product_code, self._relative_cost,
+                        self._tick_no, self._created_at)
+
     def synchronize(self) -> None:
         """Reload the product from the database.
 
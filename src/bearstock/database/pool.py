@@ -0,0 +1,180 @@
+from typing import NamedTuple, Optional
+
+import queue
+import sqlite3
+import threading
+
+from .errors import BearDatabaseError
+
+__all__ = [
+    'ConnectionPool', 'ConnectionProfile', 'open_connection',
+]
+
+
+class ConnectionProfile(NamedTuple):
+    """Tuning of a SQLite3 connection. Fields set to None keep the SQLite default.
+
+    Attributes:
+        journal_mode: Journal mode, eg. ``'WAL'``. The journal mode is stored in the
+            database file, so all connections should agree on it.
+        busy_timeout: Milliseconds to retry when the database is locked.
+        synchronous: Synchronous level, eg. ``'NORMAL'`` or ``'FULL'``.
+        cache_size: Page cache size. Negative values are in KiB, positive in pages.
+        mmap_size: Bytes of the database file to memory map.
+        wal_autocheckpoint: WAL pages before a committing connection checkpoints by
+            itself. Zero disables automatic checkpoints.
+    """
+    journal_mode: Optional[str] = None
+    busy_timeout: Optional[int] = 5000
+    synchronous: Optional[str] = None
+    cache_size: Optional[int] = None
+    mmap_size: Optional[int] = None
+    wal_autocheckpoint: Optional[int] = None
+
+    def apply(self, connection: sqlite3.Connection) -> None:
+        """Configure ``connection`` with the profile."""
+        for pragma, value in zip(self._fields, self):
+            if value is not None:
+                connection.execute(f'PRAGMA {pragma} = {value}').fetchall()
+
+
+# default profile, leaves the database as SQLite configures it
+ConnectionProfile.DEFAULT = ConnectionProfile()
+
+# profile for the Exchange and the web workers sharing one database file
+# WAL lets readers run concurrently with the writer, and the writer commits without
+# an fsync of the database file; the Exchange checkpoints between ticks
+ConnectionProfile.CONCURRENT = ConnectionProfile(
+    journal_mode='WAL',
+    busy_timeout=10000,
+    synchronous='NORMAL',
+    cache_size=-16000,
+    mmap_size=64*1024*1024,
+    wal_autocheckpoint=10000,
+)
+
+
+def open_connection(db_file: str, *,
+                    profile: ConnectionProfile = ConnectionProfile.DEFAULT,
+                    check_same_thread: bool = True) -> sqlite3.Connection:
+    """Open a connection to ``db_file`` and do the initializations required by `Database`."""
+    connection = sqlite3.connect(db_file, check_same_thread=check_same_thread)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA foreign_keys = ON')
+    # prices computed in SQL must round like the Python code does
+    connection.create_function('py_round', 1, _py_round)
+    profile.apply(connection)
+    return connection
+
+
+def _py_round(value: Optional[float]) -> Optional[int]:
+    return int(round(value)) if value is not None else None
+
+
+class ConnectionPool:
+    """Bounded pool of long lived SQLite3 connections to a single database file.
+
+    Connections are opened lazily, so a pool can be created before the process forks
+    (for instance by uwsgi) as long as it is not used until after the fork. Idle
+    connections are handed out most recently used first to keep their page caches hot.
+
+    Args:
+        db_file: Pathname to the SQLite3 database file.
+        size: Maximum number of connections open at the same time.
+        timeout: Seconds to wait for a connection when all are in use.
+        profile: Profile to configure new connections with.
+    """
+
+    def __init__(self, db_file: str, *, size: int = 4, timeout: float = 5.0,
+                 profile: ConnectionProfile = ConnectionProfile.DEFAULT) -> None:
+        if size < 1:
+            raise ValueError('pool size must be at least one')
+
+        self._db_file = db_file
+        self._profile = profile
+        self._size = size
+        self._timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    @property
+    def dbname(self) -> str:
+        """Name of the database file."""
+        return self._db_file
+
+    @property
+    def size(self) -> int:
+        """Maximum number of connections."""
+        return self._size
+
+    def acquire(self) -> sqlite3.Connection:
+        """Get a healthy connection from the pool, opening a new one if needed.
+
+        Raises:
+            BearDatabaseError: If no connection became available before the timeout, or
+                opening a new connection failed.
+        """
+        if self._closed:
+            raise BearDatabaseError('connection pool is closed')
+        if not self._available.acquire(timeout=self._timeout):
+            raise BearDatabaseError('no database connection available in the pool')
+
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    return open_connection(
+                        self._db_file, profile=self._profile, check_same_thread=False)
+
+                if self._is_healthy(connection):
+                    return connection
+                self._discard(connection)
+        except sqlite3.Error as e:
+            self._available.release()
+            raise BearDatabaseError('could not open database connection') from e
+        except BaseException:
+            self._available.release()
+            raise
+
+    def release(self, connection: sqlite3.Connection) -> None:
+        """Return a connection acquired from the pool.
+
+        An unfinished transaction on the connection is rolled back.
+        """
+        try:
+            if self._closed:
+                self._discard(connection)
+                return
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put(connection)
+        except sqlite3.Error:
+            self._discard(connection)
+        finally:
+            self._available.release()
+
+    def close(self) -> None:
+        """Close all idle connections. Connections in use are closed when released."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    @staticmethod
+    def _is_healthy(connection: sqlite3.Connection) -> bool:
+        try:
+            connection.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            return False
+        return not connection.in_transaction
+
+    @staticmethod
+    def _discard(connection: sqlite3.Connection) -> None:
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
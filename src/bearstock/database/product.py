@@ -1,5 +1,5 @@
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from .errors import BearDatabaseError, BearModelError
 from .model import Model
@@ -27,6 +27,9 @@ class Product(Model):
         self._quantity = quantity
         self._hidden = hidden
 
+        # derived values memoized by name, with the tick and base price they were computed for
+        self._derived: Dict[str, Tuple[Tuple[int, Optional[int]], Any]] = {}
+
     @property
     def code(self) -> Optional[str]:
         """The product code. Unique across all products, so a manually created
@@ -43,8 +46,7 @@ class Product(Model):
     @name.setter
     def name(self, name: str) -> None:
         self._name = name
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
 
     @property
     def producer(self) -> Optional[str]:
@@ -54,8 +56,7 @@ class Product(Model):
     @producer.setter
     def producer(self, producer: str) -> None:
         self._producer = producer
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
 
     @property
     def type(self) -> Optional[str]:
@@ -65,8 +66,7 @@ class Product(Model):
     @type.setter
     def type(self, type: str) -> None:
         self._type = type
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
 
     @property
     def tags(self) -> Optional[List[str]]:
@@ -76,8 +76,7 @@ class Product(Model):
     @tags.setter
     def tags(self, tags: List[str]) -> None:
         self._tags = tags
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
 
     @property
     def base_price(self) -> Optional[int]:
@@ -91,8 +90,7 @@ class Product(Model):
     @base_price.setter
     def base_price(self, base_price: int) -> None:
         self._base_price = base_price
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
 
     @property
     def quantity(self) -> Optional[int]:
@@ -107,8 +105,26 @@ class Product(Model):
     @hidden.setter
     def hidden(self, hidden: bool) -> None:
         self._hidden = hidden
-        if self.is_bound():
-            self.update_in_db()
+        self._changed()
+
+    def _derive(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Return the derived value ``name``, computing it with ``compute`` at most once
+        per tick and base price.
+
+        Raises:
+            BearModelError: If the product is not connected to a database.
+        """
+        if not self.is_bound():
+            raise BearModelError('product not connected to the database')
+
+        key = (self._database.tick_number, self._base_price)
+        derived = self._derived.get(name)
+        if derived is not None and derived[0] == key:
+            return derived[1]
+
+        value = compute()
+        self._derived[name] = (key, value)
+        return value
 
     @property
     def price_adjustment(self) -> int:
@@ -116,41 +132,48 @@ class Product(Model):
         The Value is in ``1/100`` of the currency.
 
         Note:
-            This is a derived attribute. It needs a database access to get it.
+            This is a derived attribute. It needs a database access to get it, but
+            is memoized until the next tick.
 
         Raises:
             BearModelError: If the product is not connected to a database.
         """
-        if not self.is_bound():
-            raise BearModelError('product not connected to the database')
-        return self._database.get_product_price_adjustment(self.code)
+        return self._derive(
+            'price_adjustment',
+            lambda: self._database.get_product_price_adjustment(self.code))
 
     @property
     def current_price(self) -> int:
         """Get the latest product price.
 
         Note:
-            This is a derived attribute. It needs a database access to get it.
+            This is a derived attribute. It needs a database access to get it, but
+            is memoized until the next tick or base price change.
 
         Raises:
             BearModelError: If the product is not connected to a database.
         """
-        if not self.is_bound():
-            raise BearModelError('product not connected to the database')
-        return int(round(self.base_price + self.price_adjustment/100))
+        return self._derive(
+            'current_price',
+            lambda: int(round(self.base_price + self.price_adjustment/100)))
 
     @property
     def timeline(self) -> 'ProductPriceAdjustments':
-        """Get a namedtuple with three elements: ``timestamps``, ``adjustments``, and
-        ``prices``.
+        """Get a namedtuple with four elements: ``timestamps``, ``adjustments``,
+        ``prices``, and ``sales``.
+
+        Note:
+            The timeline is memoized until the next tick or base price change, so
+            sales in the current tick are as of the first access. Use `synchronize`
+            to reload them.
 
         Raises:
             BearDatabaseError: If the database query failed.
             BearModelError: If the product is not connected to a database.
         """
-        if not self.is_bound():
-            raise BearModelError('product not connected to the database')
-        return self.get_db().get_product_historic_prices(self)
+        return self._derive(
+            'timeline',
+            lambda: self._database.get_product_historic_prices(self))
 
     def as_dict(self, *, with_derived: bool = False) -> Dict[str, Any]:
         """Return the product as a dictionary.
@@ -191,6 +214,7 @@ class Product(Model):
             raise BearDatabaseError('product not bound to any connected database')
 
         product = self.load_from_db(self._database, self.code)
+        self._derived.clear()
 
         self._name = product._name
         self._producer = product._producer
@@ -0,0 +1,116 @@
+from typing import Deque, Dict, Iterable, List, Optional
+
+import collections
+import os
+import sqlite3
+import threading
+
+from .rows import OrderRow
+
+__all__ = [
+    'RecentOrders',
+]
+
+
+class RecentOrders:
+    """Process wide ring buffer of the most recent orders in a database file.
+
+    Order ids only increase, so the buffer is reconciled with the database by loading
+    the orders with an id larger than the last id seen. When the caller already knows
+    the largest order id, and it is the one seen, no query is needed. Use `for_file` to
+    get the shared instance for a database file, and `Database.get_recent_orders` to get
+    orders which are up to date.
+
+    Args:
+        size: Number of orders kept.
+
+    Note:
+        Instances are thread safe.
+    """
+
+    SIZE = 100
+
+    _instances: Dict[str, 'RecentOrders'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, size: int = SIZE) -> None:
+        self._lock = threading.Lock()
+        self._size = size
+        self._orders: Deque[OrderRow] = collections.deque(maxlen=size)
+        self._last_id: Optional[int] = None
+
+    @classmethod
+    def for_file(cls, db_file: str) -> 'RecentOrders':
+        """Get the buffer shared by all databases connected to ``db_file``."""
+        key = os.path.abspath(db_file)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls()
+            return cls._instances[key]
+
+    @property
+    def size(self) -> int:
+        """Number of orders kept."""
+        return self._size
+
+    def add(self, orders: Iterable[OrderRow]) -> None:
+        """Add orders just inserted, oldest first.
+
+        An order is only added if it directly follows the last order seen, so orders
+        inserted by other processes in between are left to `refresh` instead of lost.
+        """
+        with self._lock:
+            for order in orders:
+                if self._last_id is None or order.uid != self._last_id + 1:
+                    break
+                self._orders.append(order)
+                self._last_id = order.uid
+
+    def refresh(self, db: 'Database', last_order_id: Optional[int] = None) -> None:
+        """Load orders newer than the last order seen from ``db``.
+
+        Args:
+            db: Database to load from.
+            last_order_id: The largest order id in the database, if already known.
+                If it is the last id seen nothing is loaded.
+
+        Raises:
+            BearDatabaseError: If the database query failed.
+        """
+        def action(cursor: sqlite3.Cursor) -> List[OrderRow]:
+            return list(map(OrderRow._make, cursor))
+
+        with self._lock:
+            if last_order_id is None:
+                last_order_id = db.get_last_order_id()
+            if self._last_id is not None:
+                if last_order_id == self._last_id:
+                    return
+                if last_order_id < self._last_id:
+                    # the orders were rewritten, start over
+                    self._orders.clear()
+                    self._last_id = None
+
+            orders = db.exe((
+                f'SELECT {OrderRow.COLUMNS} FROM orders '
+                'WHERE id > :last '
+                'ORDER BY id DESC '
+                'LIMIT :size'),
+                args={'last': self._last_id if self._last_id is not None else -1,
+                      'size': self._size},
+                callable=action,
+                plain_rows=True
+            )
+            if len(orders) == self._size:
+                self._orders.clear()  # there may be a gap to the orders kept
+            self._orders.extend(reversed(orders))
+            if self._orders:
+                self._last_id = self._orders[-1].uid
+            elif self._last_id is None:
+                self._last_id = 0
+
+    def latest(self, count: int) -> List[OrderRow]:
+        """Get the ``count`` latest orders loaded, newest first."""
+        with self._lock:
+            orders = list(self._orders)
+        return orders[:-count - 1:-1] if count > 0 else []
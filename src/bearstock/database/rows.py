@@ -0,0 +1,78 @@
+from typing import Any, Dict, Tuple
+
+from collections import namedtuple
+
+__all__ = [
+    'BuyerRow', 'OrderRow', 'ProductRow',
+]
+
+
+class BuyerRow(namedtuple('BuyerRow', ['uid', 'name', 'username', 'icon', 'scaling', 'created_at'])):
+    """Read only buyer row. A lightweight alternative to `Buyer` for bulk reads."""
+    __slots__ = ()
+
+    COLUMNS = 'id, name, username, icon, scaling, created_at'
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the buyer as `Buyer.as_dict` does, with ``last_order_at`` set to None."""
+        return dict(
+            id=self.uid,
+            name=self.name,
+            username=self.username,
+            icon=self.icon,
+            scaling=self.scaling,
+            last_order_at=None,
+            created_at=self.created_at,
+        )
+
+
+class OrderRow(namedtuple('OrderRow', ['uid', 'buyer_id', 'product_code', 'relative_cost',
+                                       'tick_no', 'created_at'])):
+    """Read only order row. A lightweight alternative to `Order` for bulk reads."""
+    __slots__ = ()
+
+    COLUMNS = 'id, buyer_id, product_code, relative_cost, tick_no, created_at'
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the order as `Order.as_dict` does without derived fields."""
+        return dict(
+            id=self.uid,
+            buyer_id=self.buyer_id,
+            product_code=self.product_code,
+            relative_cost=self.relative_cost,
+            tick_no=self.tick_no,
+            created_at=self.created_at,
+            buyer=None,
+            product=None,
+            price=None,
+        )
+
+
+class ProductRow(namedtuple('ProductRow', ['code', 'name', 'producer', 'base_price', 'quantity',
+                                           'type', 'tags', 'hidden'])):
+    """Read only product row. A lightweight alternative to `Product` for bulk reads."""
+    __slots__ = ()
+
+    COLUMNS = 'code, name, producer, base_price, quantity, type, tags, hidden'
+
+    @classmethod
+    def from_tuple(cls, row: Tuple[Any, ...]) -> 'ProductRow':
+        """Create from a tuple of the `COLUMNS` values, splitting the stored tags."""
+        code, name, producer, base_price, quantity, type, tags, hidden = row
+        return cls(code, name, producer, base_price, quantity, type, tags.split('|'), hidden)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the product as `Product.as_dict` does without derived fields."""
+        return dict(
+            code=self.code,
+            name=self.name,
+            producer=self.producer,
+            type=self.type,
+            tags=self.tags,
+            base_price=self.base_price,
+            quantity=self.quantity,
+            hidden=self.hidden,
+            current_price=None,
+            price_adjustment=None,
+            timeline=None,
+        )
@@ -0,0 +1,69 @@
+from typing import List, Sequence, Tuple
+
+__all__ = [
+    'lttb',
+]
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], points: int) -> Tuple[List[float], List[float]]:
+    """Downsample a series with the largest-triangle-three-buckets algorithm.
+
+    The first and last points are kept, and the points between are split into
+    ``points - 2`` buckets. From each bucket the point forming the largest triangle with
+    the point kept from the previous bucket and the average of the next bucket is kept.
+    This preserves the peaks and dips of the series, which plain decimation loses.
+
+    Args:
+        xs: X values, increasing.
+        ys: Y values, as many as ``xs``.
+        points: Number of points to keep.
+
+    Returns:
+        The kept x and y values. If the series has no more than ``points`` points it is
+        returned as is.
+
+    Raises:
+        ValueError: If ``xs`` and ``ys`` have different lengths, or ``points`` is less
+            than 3.
+    """
+    if len(xs) != len(ys):
+        raise ValueError('xs and ys have different lengths')
+    if points < 3:
+        raise ValueError('cannot downsample to fewer than 3 points')
+
+    length = len(xs)
+    if length <= points:
+        return list(xs), list(ys)
+
+    out_xs = [xs[0]]
+    out_ys = [ys[0]]
+
+    bucket_size = (length - 2)/(points - 2)
+    kept = 0
+    for bucket in range(points - 2):
+        start = int(bucket*bucket_size) + 1
+        end = int((bucket + 1)*bucket_size) + 1
+
+        # average of the next bucket, or the last point for the last bucket
+        next_start = end
+        next_end = min(int((bucket + 2)*bucket_size) + 1, length)
+        if next_start >= next_end:
+            next_start, next_end = length - 1, length
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end])/count
+        avg_y = sum(ys[next_start:next_end])/count
+
+        kept_x, kept_y = xs[kept], ys[kept]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((kept_x - avg_x)*(ys[i] - kept_y) - (kept_x - xs[i])*(avg_y - kept_y))
+            if area > best_area:
+                best, best_area = i, area
+
+        out_xs.append(xs[best])
+        out_ys.append(ys[best])
+        kept = best
+
+    out_xs.append(xs[-1])
+    out_ys.append(ys[-1])
+    return out_xs, out_ys
@@ -63,8 +63,8 @@ def main():
     db.connect()
 
     # ensure schema exists
-    for statement in open('schema.sql').read().split(';'):
-        db.exe(statement)
+    db.execute_script(open('schema.sql').read())
+    db.migrate()
 
     # set configuration
     db.set_config_stock_running(False)
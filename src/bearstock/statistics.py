@@ -1,5 +1,5 @@
+from bearstock.database import Database
 
-from .stock import Database
 
 def get_top_bot(count, db=None):
     """Get ``count`` top and bottom traders.
@@ -8,6 +8,8 @@ def get_top_bot(count, db=None):
     ----------
     count : int
         Number of top/bottom traders to get.
+    db : Database, optional
+        Connected database to read from. Defaults to the Exchange database.
 
     Returns
     -------
@@ -18,48 +20,37 @@ def get_top_bot(count, db=None):
          * ``top`` and ``bottom`` a tuple containing ``count`` dicts, each
            containing the keys:
             * ``id``: Trader ID.
+            * ``name``, ``username``, ``icon``: Trader details.
             * ``turnover``: Total turnover for the trader.
             * ``profit``: Profit relative to base price of products bought.
+            * ``count``: Number of orders by the trader.
 
         If there are fewer traders than ``count``, the lists are shorter than
         ``count``.
+
+    Notes
+    -----
+    Profit and turnover are kept up to date per trader as orders are inserted,
+    and the traders are read in profit order from an index, so the cost does
+    not grow with the number of traders or orders.
     """
     # get data from DB
     if db is None:
-        db = Database.default()
-
-    buyers = db.buyer_dict()
-
-    orders = db.read_all_orders()
-    # parse orders
-    traders = {}  # list of traders
-    for order in orders:
-        # Order fields
-        #   oid       : order id
-        #   bid       : buyer id
-        #   code      : product code
-        #   pid       : price id
-        #   rel_cost  : relative cost from product base price
-        #   abs_cost  : absolut cost the buyer paid
-        #   timestamp : order timestamp
-        oid, bid, code, pid, rel_cost, abs_cost, timestamp = order
-        # add data
-        if bid not in traders:
-            traders[bid] = {
-                'id': bid,
-                'name': buyers[bid],
-                'turnover': 0,
-                'profit': 0,
-            }
-        traders[bid]['turnover'] += abs_cost
-        traders[bid]['profit'] += -rel_cost
-    # construct the list
-    traders = sorted(traders.values(), key=(lambda trader: trader['profit']), reverse=True)
+        from .stock import Exchange
+        db = Database(Exchange.DATABASE_FILE)
+        db.connect()
+        try:
+            return get_top_bot(count, db)
+        finally:
+            db.close()
+
+    top = db.get_leaderboard(count, best=True)
+    bottom = db.get_leaderboard(count, best=False)
     # data!
     return {
-        'count': min(count, len(traders)),
-        'top': tuple(traders[0:count]),
-        'bottom': tuple(traders[-count:][::-1]),
+        'count': len(top),
+        'top': tuple(top),
+        'bottom': tuple(bottom),
     }
 
 if __name__ == '__main__':
@@ -1,19 +1,50 @@
 from collections import defaultdict
 from datetime import datetime
 from threading import Thread
+from typing import Optional, Tuple
 import logging
+import os
 import pickle
+import select
+import socket
 import sqlite3
 import time
 
-from bearstock.database import Database
+from bearstock.database import BearDatabaseError, ConnectionProfile, Database
 from bearstock.price_logic_table import PriceLogic
 
 
+def next_tick_due(last_timestamp: Optional[int], tick_length: int, now: float) -> Tuple[int, bool]:
+    """Get when the next tick is due.
+
+    Ticks are scheduled a tick length after the previous tick was scheduled, so the time
+    spent computing ticks does not add up. A tick which is late by less than a tick length
+    is due right away, to catch up. If a whole tick was missed, for instance because the
+    stock was closed, the schedule is restarted a tick length from now.
+
+    Args:
+        last_timestamp: Scheduled time of the last tick, or None if there are no ticks.
+        tick_length: Seconds between ticks.
+        now: Current time.
+
+    Returns:
+        The time the next tick is due, and whether the schedule was restarted.
+    """
+    if last_timestamp is not None:
+        due = last_timestamp + tick_length
+        if now - due < tick_length:
+            return due, False
+    return int(now) + tick_length, True
+
+
 class Exchange:
     """Server running the stock exchange."""
 
     DATABASE_FILE = 'bear-app.db'
+    # datagram socket the Exchange is woken by when the config changes
+    WAKEUP_SOCKET = 'bear-exchange.sock'
+    # seconds between config checks while closed, in case a wakeup was missed
+    CLOSED_POLL_INTERVAL = 60
 
     def __init__(self, db):
         self.db = db
@@ -43,7 +74,7 @@ class Exchange:
     @classmethod
     def run_default(self):
         db = Database(Exchange.DATABASE_FILE)
-        db.connect()
+        db.connect(profile=ConnectionProfile.CONCURRENT)
 
         Exchange(db).run()
 
@@ -54,32 +85,107 @@ class Exchange:
                         daemon=True)
         thread.start()
 
-    def run(self):
-        self.logger.info('Running stock in the background')
-
+    @classmethod
+    def wake(cls) -> bool:
+        """Wake a waiting Exchange, so it rereads the config right away.
+
+        Returns:
+            True if an Exchange was woken, False if none is listening.
+        """
+        if not hasattr(socket, 'AF_UNIX'):
+            return False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            try:
+                sock.sendto(b'wake', cls.WAKEUP_SOCKET)
+            except OSError:
+                return False
+        return True
+
+    def _open_wakeup_socket(self) -> Optional[socket.socket]:
+        if not hasattr(socket, 'AF_UNIX'):
+            self.logger.warning('No unix sockets, config changes are only seen by polling')
+            return None
+        if os.path.exists(self.WAKEUP_SOCKET):
+            os.unlink(self.WAKEUP_SOCKET)  # left by an Exchange which did not exit cleanly
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.WAKEUP_SOCKET)
+        sock.setblocking(False)
+        return sock
+
+    def _wait(self, wakeup: Optional[socket.socket], deadline: float) -> bool:
+        """Wait until the monotonic clock reaches ``deadline``, or a wakeup arrives.
+
+        Returns:
+            True if woken before the deadline.
+        """
         while True:
-            # checkk if the stock is started
-            if not self.db.get_config_stock_running():
-                self.logger.info('Stock is closed')
-                time.sleep(10)
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return False
+            if wakeup is None:
+                time.sleep(timeout)
                 continue
 
-            # determine wait
-            self.logger.info('Stock is ticking')
-
-            pending = self.db.get_tick_last_timestamp() - time.time()
-            if pending <= 0:
-                pending = self.db.get_config_tick_length()
+            readable, _, _ = select.select([wakeup], [], [], timeout)
+            if readable:
+                try:
+                    while wakeup.recv(64):
+                        pass
+                except BlockingIOError:
+                    pass
+                return True
 
-            if pending > 0:
-                self.logger.info(f'Stock is waiting for {pending} s')
-                time.sleep(pending)
-
-            # action!
-            self.logger.info('Stock is about perform tick')
-            self.tick()
+    def run(self):
+        self.logger.info('Running stock in the background')
 
-    def tick(self):
+        wakeup = self._open_wakeup_socket()
+        try:
+            while True:
+                # check if the stock is started
+                if not self.db.get_config_stock_running():
+                    self.logger.info('Stock is closed')
+                    self._wait(wakeup, time.monotonic() + self.CLOSED_POLL_INTERVAL)
+                    continue
+
+                # determine wait
+                self.logger.info('Stock is ticking')
+
+                tick_length = self.db.get_config_tick_length()
+                due, restarted = next_tick_due(
+                    self.db.get_tick_last_timestamp(), tick_length, time.time())
+                if restarted:
+                    self.logger.info(f'Starting a new tick schedule, next tick at {due}')
+
+                # wait on the monotonic clock, so changes to the wall clock don't matter
+                pending = due - time.time()
+                if pending > 0:
+                    self.logger.info(f'Stock is waiting for {pending:.1f} s')
+                    if self._wait(wakeup, time.monotonic() + pending):
+                        self.logger.info('Woken up, rereading the config')
+                        continue
+
+                # action!
+                lateness = time.time() - due
+                self.logger.info(f'tick_lateness_seconds={lateness:.3f}')
+                self.logger.info('Stock is about perform tick')
+                self.tick(timestamp=due)
+                self.checkpoint()
+        finally:
+            if wakeup is not None:
+                wakeup.close()
+                os.unlink(self.WAKEUP_SOCKET)
+
+    def checkpoint(self):
+        """Move the tick just written from the write-ahead log into the database file.
+
+        Runs right after a tick, when the mule is idle until the next one. The checkpoint
+        is passive, so it never blocks the web workers reading or inserting orders.
+        """
+        busy, log_pages, checkpointed = self.db.checkpoint('PASSIVE')
+        self.logger.info(f'Checkpointed {checkpointed} of {log_pages} WAL pages'
+                         f'{" (blocked by readers)" if busy else ""}')
+
+    def tick(self, timestamp: Optional[int] = None):
         # what's left of the budget
         surplus = self.db.get_config_budget() + self.db.get_purchase_surplus()
 
@@ -137,4 +243,13 @@ class Exchange:
 
         # register the new tick in the database
         self.logger.info(f'Storing new price adjustments: {completed_adjustments}')
-        self.db.do_tick(completed_adjustments)
+        self.db.do_tick(completed_adjustments, timestamp=timestamp)
+
+        # render the board once for all clients, if that fails the first reader does
+        try:
+            snapshot = self.db.publish_board_snapshot()
+        except BearDatabaseError:
+            self.logger.exception('Could not publish the board snapshot')
+        else:
+            self.logger.info(f'Published board snapshot of {len(snapshot.body)} bytes '
+                             f'({len(snapshot.body_gzip)} gzipped)')
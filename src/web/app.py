@@ -1,10 +1,16 @@
 
-from flask import Flask, render_template, g, jsonify, request, redirect
+from flask import Flask, Response, render_template, g, jsonify, request, redirect
+from contextlib import closing
+from functools import wraps
+import bisect
 import json
 import datetime
 import time
 
-from bearstock.database import Database, Buyer
+from bearstock.database import (
+    BearDatabaseError, ConnectionPool, ConnectionProfile, Database, Buyer, RecentOrders,
+)
+from bearstock.downsample import lttb
 from bearstock.statistics import get_top_bot
 
 DATABASE_FILE = 'bear-app.db'
@@ -13,17 +19,51 @@ app = Flask(__name__)
 app.config['DEBUG'] = True
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
+# connections are opened on first use, so every uwsgi worker gets its own
+pool = ConnectionPool(DATABASE_FILE, size=4, profile=ConnectionProfile.CONCURRENT)
+# latest orders, kept in memory by every worker
+recent_orders = RecentOrders.for_file(DATABASE_FILE)
+
 @app.before_request
 def before_request():
-    g.db: Database = Database(DATABASE_FILE)
+    g.db: Database = Database(DATABASE_FILE, pool=pool)
     g.db.connect()
 
 @app.teardown_request
 def teardown_request(exception):
     db = getattr(g, 'db', None)
-    if db is not None:
+    if db is not None and db.is_connected():
         db.close()
 
+def conditional_on(token):
+    """Answer ``If-None-Match`` with 304 while ``token()`` is unchanged.
+
+    The check runs before the view, so unchanged polls skip loading and serializing.
+    Every response carries the server time in ``X-Server-Time``, since the body of a
+    revalidated response is the one cached by the browser.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = token()
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = view(*args, **kwargs)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Server-Time'] = str(time.time())
+            return response
+        return wrapper
+    return decorator
+
+# revalidate on the database version token, which changes with every write
+conditional = conditional_on(lambda: g.db.get_version_token())
+
+# revalidate on the board snapshot key, which orders don't change, for the views
+# which only change with ticks and products
+conditional_board = conditional_on(lambda: f'board-{g.db.tick_number}-{g.db.catalog}')
+
 @app.route('/register')
 def index():
     return render_template('index.html')
@@ -77,64 +117,405 @@ def buyers_update(id):
 
 @app.route('/orders', methods=['POST'])
 def orders_create():
-    body = request.get_json()
-    product = g.db.get_product(body['product_code'])
-    buyer = g.db.get_buyer(body['buyer_id'])
-    tick_no = g.db.get_tick_number()
-    price = body['price']
-    order = g.db.insert_order(
-        buyer=buyer, product=product,
-        relative_cost=(price-product.base_price),
-        tick_no=tick_no)
-    return jsonify(ok=True, order=order.as_dict(with_derived=True))
+    """Insert an order at the current price.
+
+    The price sent by the register is only compared to the price charged, which is
+    resolved by the database, and ``price_changed`` tells if they differ.
+    """
+    body = request.get_json(silent=True)
+    try:
+        buyer_id = int(body['buyer_id'])
+        code = str(body['product_code'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify(ok=False, error='malformed order'), 400
+
+    try:
+        order = g.db.insert_order_at_current_price(buyer_id, code)
+    except BearDatabaseError:
+        return jsonify(ok=False, error='unknown buyer or product'), 400
+    except ValueError:
+        return jsonify(ok=False, error='product has no current price'), 400
+    recent_orders.add([order.as_row()])
+    data = order.as_dict(with_derived=True)
+    return jsonify(ok=True, order=data, price_changed=body.get('price') != data['price'])
+
+# most orders accepted in one batch
+MAX_BATCH_ORDERS = 50
+
+@app.route('/orders/batch', methods=['POST'])
+def orders_create_batch():
+    """Insert a round of orders in one transaction.
+
+    The body is ``{"orders": [{"buyer_id", "product_code", "price"}, ...]}``. Every
+    buyer and product is loaded once, and either all orders are inserted or none. Like
+    for `orders_create` the prices are resolved by the database, and the price sent
+    is only compared to the price charged.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('orders') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_ORDERS:
+        return jsonify(ok=False, error=f'expected 1 to {MAX_BATCH_ORDERS} orders'), 400
+
+    buyers = {}
+    products = {}
+    orders = []
+    prices = []
+    # a product without a current price rolls back the orders inserted before it
+    try:
+        with g.db.transaction(immediate=True):
+            for item in items:
+                try:
+                    buyer_id = int(item['buyer_id'])
+                    code = str(item['product_code'])
+                except (KeyError, TypeError, ValueError):
+                    return jsonify(ok=False, error='malformed order'), 400
+
+                try:
+                    if buyer_id not in buyers:
+                        buyers[buyer_id] = g.db.get_buyer(buyer_id)
+                    if code not in products:
+                        products[code] = g.db.get_product(code)
+                except BearDatabaseError:
+                    return jsonify(ok=False, error='unknown buyer or product'), 400
+                buyer, product = buyers[buyer_id], products[code]
+
+                orders.append({'buyer': buyer, 'product': product})
+                prices.append(item.get('price'))
+            orders = g.db.insert_orders_at_current_price(orders)
+    except ValueError:
+        return jsonify(ok=False, error='product has no current price'), 400
+    recent_orders.add(order.as_row() for order in orders)
+
+    # derived fields from the models loaded above, not a lookup per order
+    as_dicts = {code: product.as_dict(with_derived=True) for code, product in products.items()}
+    created = []
+    for order, price in zip(orders, prices):
+        data = order.as_dict()
+        product = products[data['product_code']]
+        data.update(
+            buyer=buyers[data['buyer_id']].as_dict(),
+            product=as_dicts[product.code],
+            price=product.base_price + order.relative_cost,
+        )
+        data['price_changed'] = price != data['price']
+        created.append(data)
+    return jsonify(ok=True, orders=created)
+
+def order_dict(order, buyers, products):
+    """Serialize an order row with derived fields, taking the buyer from ``buyers`` (id
+    to buyer dict) and the product from ``products`` (code to product dict).
+    """
+    data = order.as_dict()
+    product = products[order.product_code]
+    data.update(
+        buyer=buyers[order.buyer_id],
+        product=product,
+        price=product['base_price'] + order.relative_cost,
+    )
+    return data
+
+def snapshot_response(body, body_gzip=None):
+    """Respond with pre-encoded JSON bytes, using the gzip encoded bytes if the client
+    accepts them.
+    """
+    if body_gzip is not None and request.accept_encodings['gzip']:
+        response = Response(body_gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+# latest orders shown in the register
+REGISTER_ORDERS = 30
 
 @app.route('/register.json')
+@conditional
 def register_json():
-    tick_no = g.db.get_tick_number()
-    products = [p.as_dict(with_derived=True) for p in g.db.get_all_products() if not p.hidden]
-    buyers = g.db.get_all_buyers()
-    orders = g.db.get_latest_orders(count=30)
-    return jsonify(
+    """Everything the register shows.
+
+    With ``?since_order=M`` only orders after order ``M`` are sent, without the buyers,
+    and with ``?since_tick=N`` the products are left out unless there has been a tick
+    after tick ``N``. If there are more new orders than the register shows, the full
+    document is sent instead. ``full`` tells which one the client got. ``sales`` is
+    always sent, as the board leaves out the sales of the current tick.
+    """
+    since_order = request.args.get('since_order', type=int)
+    since_tick = request.args.get('since_tick', type=int)
+
+    tick_no = g.db.tick_number
+    fields = dict(
         tick_no=tick_no,
-        products=products,
-        buyers=[buyer.as_dict() for buyer in buyers ],
-        orders=[order.as_dict(with_derived=True) for order in orders ],
+        last_order_id=g.db.get_last_order_id(),
         is_open=g.db.get_config_stock_running(),
         now=time.time(),
         quarantine=g.db.get_config_quarantine(),
+        sales=g.db.get_tick_sales(tick_no),
     )
 
-@app.route('/buyers.json')
-def buyers_json():
-    buyers = g.db.get_all_buyers()
+    orders = None
+    if since_order is not None:
+        orders = g.db.get_orders_since(since_order, limit=REGISTER_ORDERS + 1)
+    if orders is not None and len(orders) <= REGISTER_ORDERS:
+        products = {p.code: p for p in g.db.get_all_products(include_hidden=True, rows=True)}
+        fields.update(full=False, orders=[order_event(order, products) for order in orders])
+        if since_tick is not None and since_tick == tick_no:
+            return jsonify(**fields)
+    else:
+        # served from memory unless other workers took orders
+        orders = g.db.get_recent_orders(REGISTER_ORDERS, last_order_id=fields['last_order_id'])
+        buyers = buyer_dicts(g.db)
+        by_code = {}
+        if orders:
+            # the register takes the prices from the board, the orders only need the rows
+            by_code = {product.code: product.as_dict()
+                       for product in g.db.get_all_products(include_hidden=True, rows=True)}
+        by_id = {buyer['id']: buyer for buyer in buyers}
+        fields.update(
+            full=True,
+            buyers=buyers,
+            orders=[order_dict(order, by_id, by_code) for order in orders ],
+        )
+
+    # splice the other fields into the snapshot document {"products": [...]}
+    snapshot = g.db.get_board_snapshot()
+    rest = json.dumps(fields)
+    return snapshot_response(snapshot.body[:-1] + b', ' + rest[1:].encode('utf-8'))
+
+def buyer_dicts(db, *, with_stats=False):
+    """Serialize all buyers with their last order time, using a fixed number of queries."""
+    stats = db.get_all_buyer_cost_stats()
     dicts = []
-    for buyer in buyers:
+    for buyer in db.get_all_buyers(rows=True):
         d = buyer.as_dict()
-        d['relative_cost_stats'] = buyer.relative_cost_stats()
+        buyer_stats = stats[buyer.uid]
+        d['last_order_at'] = buyer_stats['last_order_at']
+        if with_stats:
+            d['relative_cost_stats'] = {'sum': buyer_stats['sum'], 'count': buyer_stats['count']}
         dicts.append(d)
+    return dicts
+
+@app.route('/buyers.json')
+@conditional
+def buyers_json():
+    return jsonify(buyers=buyer_dicts(g.db, with_stats=True))
+## Events
+
+# seconds between checks for new ticks and orders, and between keep-alive comments
+EVENTS_POLL_INTERVAL = 0.5
+EVENTS_KEEPALIVE = 15
+# ticks or orders to replay on resume before asking the client to resync instead
+EVENTS_MAX_REPLAY = 500
+# seconds a stream is kept open before the client must reconnect, so a stream only
+# holds a worker (or worker thread) for a while
+EVENTS_MAX_AGE = 25
+
+def sse(event, data, event_id=None):
+    """Format a server-sent event."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def parse_event_id(event_id):
+    """Parse an event id ``<tick_no>-<order_id>`` to a tuple, or None if malformed."""
+    try:
+        tick_no, order_id = event_id.split('-')
+        return int(tick_no), int(order_id)
+    except (AttributeError, ValueError):
+        return None
+
+def tick_event(tick, products):
+    """Event data for a new tick, with the prices of ``products`` (code to row dict)."""
+    prices = {}
+    for code, adjustment in tick.adjustments.items():
+        product = products.get(code)
+        if product is not None:
+            prices[code] = {
+                'price_adjustment': adjustment,
+                'current_price': int(round(product.base_price + adjustment/100)),
+            }
+    return {'tick_no': tick.tick_no, 'timestamp': tick.timestamp, 'prices': prices}
+
+def order_event(order, products):
+    """Event data for a new order."""
+    data = order.as_dict()
+    product = products.get(order.product_code)
+    if product is not None:
+        data['price'] = product.base_price + order.relative_cost
+    return data
+
+def event_stream(cursor):
+    """Yield events for ticks and orders newer than ``cursor`` (a ``(tick_no, order_id)``
+    tuple), or for everything new from now on if ``cursor`` is None.
+
+    The database is the channel between processes: the Exchange and every web worker
+    write to it, and each stream watches it for new ticks and orders, so events reach
+    clients connected to any worker. A pooled connection is only held while checking,
+    and checking an unchanged database is a single small query.
+
+    The stream ends after ``EVENTS_MAX_AGE`` seconds. It ends with the id of the last
+    event, so the client resumes from there when it reconnects.
+    """
+    def connect():
+        db = Database(DATABASE_FILE, pool=pool)
+        db.connect()
+        return closing(db)
+
+    if cursor is None:
+        with connect() as db:
+            cursor = (db.get_tick_number(), db.get_last_order_id())
+    tick_no, order_id = cursor
+    yield 'retry: 2000\n\n'
+
+    token = None
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < EVENTS_MAX_AGE:
+        events = []
+        with connect() as db:
+            current = db.get_version_token()
+            if current != token:
+                token = current
+                products = {p.code: p for p in db.get_all_products(include_hidden=True, rows=True)}
+
+                ticks = db.get_ticks_since(tick_no, limit=EVENTS_MAX_REPLAY + 1)
+                orders = []
+                if len(ticks) <= EVENTS_MAX_REPLAY:
+                    orders = db.get_orders_since(order_id, limit=EVENTS_MAX_REPLAY + 1)
+                if len(ticks) > EVENTS_MAX_REPLAY or len(orders) > EVENTS_MAX_REPLAY:
+                    # too far behind, the client should reload everything
+                    tick_no = db.get_tick_number()
+                    order_id = db.get_last_order_id()
+                    events.append(sse('resync', {}, f'{tick_no}-{order_id}'))
+                else:
+                    for tick in ticks:
+                        tick_no = tick.tick_no
+                        events.append(sse('tick', tick_event(tick, products), f'{tick_no}-{order_id}'))
+                    for order in orders:
+                        order_id = order.uid
+                        events.append(sse('order', order_event(order, products), f'{tick_no}-{order_id}'))
+
+        if events:
+            yield ''.join(events)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= EVENTS_KEEPALIVE:
+            yield ': keep-alive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(EVENTS_POLL_INTERVAL)
+
+    # an id without data sets the client's Last-Event-ID without dispatching an event
+    yield f'id: {tick_no}-{order_id}\n\n'
+
+@app.route('/events')
+def events():
+    cursor = parse_event_id(request.headers.get('Last-Event-ID'))
+    # the stream does not use the request connection, so give it back right away
+    g.db.close()
+    return Response(event_stream(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
-    return jsonify(buyers=dicts)
 ## Plots
 
+# downsampled price series by request parameters, each stored with the key it was
+# computed for, so request threads never mix series of different ticks
+stocks_cache = {}
+
+def price_series(db, points, start, end):
+    """Get ``(code, timestamps, prices)`` for all products, limited to timestamps in
+    [``start``, ``end``] and downsampled to ``points`` points.
+
+    Series only change with a new tick or a base price change, so they are cached
+    in the worker until then.
+    """
+    products = db.get_all_products(include_hidden=True, rows=True)
+    key = (db.tick_number, tuple((product.code, product.base_price) for product in products))
+
+    params = (points, start, end)
+    cached = stocks_cache.get(params)
+    if cached is not None and cached[0] == key:
+        series = cached[1]
+    else:
+        history = db.tick_history
+        series = []
+        for product in products:
+            timestamps, _, prices = history.get_product(product.code, product.base_price)
+            lo = bisect.bisect_left(timestamps, start) if start is not None else 0
+            hi = bisect.bisect_right(timestamps, end) if end is not None else len(timestamps)
+            timestamps, prices = timestamps[lo:hi], prices[lo:hi]
+            if points is not None:
+                timestamps, prices = lttb(timestamps, prices, points)
+            series.append((product.code, timestamps, prices))
+        if len(stocks_cache) >= 16:
+            stocks_cache.clear()
+        stocks_cache[params] = (key, series)
+    return series
+
+# most ticks sent as a delta before the client gets the full history instead
+STOCKS_MAX_DELTA = 60
+
 @app.route('/stocks.json')
+@conditional_board
 def stocks_json():
-    products = g.db.get_all_products()
-    stocks = []
-    for product in products:
-        time = product.timeline[0]
-        prices = product.timeline[2]
+    """Price history of all products, as chart series.
+
+    With ``?since_tick=N`` only the points of ticks after tick ``N`` are sent, unless
+    the client is too far behind, in which case the full history is sent. ``full``
+    tells which one the client got. The other parameters only apply to full histories.
+    """
+    # malformed values are ignored
+    points = request.args.get('points', type=int)
+    start = request.args.get('from', type=int)
+    end = request.args.get('to', type=int)
+    since_tick = request.args.get('since_tick', type=int)
+    if points is not None:
+        points = max(points, 3)
+
+    tick_no = g.db.tick_number
+    if since_tick is not None and 0 <= tick_no - since_tick <= STOCKS_MAX_DELTA:
+        products = g.db.get_all_products(include_hidden=True, rows=True)
+        values = {product.code: [] for product in products}
+        base_prices = {product.code: product.base_price for product in products}
+        for tick in g.db.get_ticks_since(since_tick):
+            for code, adjustment in tick.adjustments.items():
+                if code in values:
+                    price = int(round(base_prices[code] + adjustment/100))
+                    values[code].append({'x': tick.timestamp, 'y': price})
+        stocks = [{'key': code, 'values': new_values} for code, new_values in values.items()]
+        return jsonify(stocks=stocks, tick_no=tick_no, full=False)
 
+    stocks = []
+    for code, timestamps, prices in price_series(g.db, points, start, end):
         stocks.append({
-            'key': product.code,
-            'values': list({'x': x, 'y': y} for x, y in zip(time, prices))
+            'key': code,
+            'values': list({'x': x, 'y': y} for x, y in zip(timestamps, prices))
         })
-    return jsonify(stocks=stocks)
+    return jsonify(stocks=stocks, tick_no=tick_no, full=True)
 
 @app.route('/products.json')
+@conditional_board
 def products_json():
-    products = [p.as_dict(with_derived=True) for p in g.db.get_all_products() if not p.hidden]
-    return jsonify(products=products)
+    """The board snapshot. The sales of the current tick are in ``/register.json``."""
+    snapshot = g.db.get_board_snapshot()
+    return snapshot_response(snapshot.body, snapshot.body_gzip)
+
+
+@app.route('/leaderboard.json')
+@conditional
+def leaderboard_json():
+    count = min(max(request.args.get('count', 10, type=int), 0), 100)
+    return jsonify(**get_top_bot(count, g.db))
 
+@app.route('/budget.json')
+@conditional
+def budget_json():
+    totals = g.db.get_ledger_totals()
+    budget = g.db.get_config_budget()
+    remaining = None if budget is None else budget + totals['surplus']
+    return jsonify(budget=budget, remaining=remaining, **totals)
 
 @app.route('/stats')
 def stats():
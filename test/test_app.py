@@ -0,0 +1,160 @@
+import os
+
+import pytest
+
+from bearstock.database import ConnectionPool, ConnectionProfile, Database, RecentOrders
+from web import app as web_app
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+
+@pytest.fixture
+def db(tmpdir, monkeypatch):
+    path = str(tmpdir.join('bear-app.db'))
+    db = Database(path)
+    db.connect()
+    db.execute_script(open(SCHEMA_FILE).read())
+
+    db.import_products([
+        {'code': 'FYPA', 'name': 'Pale Ale', 'producer': 'Frydenlund', 'type': 'beer',
+         'tags': [], 'base_price': 35, 'quantity': 100, 'hidden': False},
+        {'code': 'LEBL', 'name': 'Blonde', 'producer': 'Leffe', 'type': 'beer',
+         'tags': [], 'base_price': 43, 'quantity': 100, 'hidden': False},
+    ])
+    db.do_tick({'FYPA': 150, 'LEBL': -150}, tick_no=0)
+
+    monkeypatch.setattr(web_app, 'DATABASE_FILE', path)
+    monkeypatch.setattr(web_app, 'pool', ConnectionPool(
+        path, size=1, profile=ConnectionProfile.CONCURRENT))
+    monkeypatch.setattr(web_app, 'recent_orders', RecentOrders.for_file(path))
+
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def client(db):
+    return web_app.app.test_client()
+
+
+def test_orders_batch(db, client):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+
+    response = client.post('/orders/batch', json={'orders': [
+        {'buyer_id': buyer.uid, 'product_code': 'FYPA', 'price': 36},
+        {'buyer_id': buyer.uid, 'product_code': 'LEBL', 'price': 43},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['ok']
+
+    orders = data['orders']
+    assert [order['product_code'] for order in orders] == ['FYPA', 'LEBL']
+    assert [order['price'] for order in orders] == [36, 42]
+    assert [order['price_changed'] for order in orders] == [False, True]
+    assert orders[0]['buyer']['id'] == buyer.uid
+    assert orders[0]['product']['code'] == 'FYPA'
+    assert [order['id'] for order in orders] == [order.uid for order in db.get_all_orders()]
+
+
+def test_orders_create(db, client):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+
+    response = client.post('/orders', json={'buyer_id': buyer.uid, 'product_code': 'FYPA', 'price': 35})
+    data = response.get_json()
+    assert data['ok']
+    assert data['order']['price'] == 36
+    assert data['price_changed']
+
+
+@pytest.mark.parametrize('body', [
+    [1],
+    {'buyer_id': 1},
+    {'buyer_id': 'bear', 'product_code': 'FYPA'},
+    {'buyer_id': 404, 'product_code': 'FYPA'},
+    {'buyer_id': 1, 'product_code': 'NOPE'},
+])
+def test_orders_create_rejects_bad_requests(db, client, body):
+    db.insert_buyer(name='Bear', username='bear', icon=None)
+
+    response = client.post('/orders', json=body)
+    assert response.status_code == 400
+    assert not response.get_json()['ok']
+    assert db.get_all_orders() == []
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    [1],
+    'orders',
+    {'orders': []},
+    {'orders': {'buyer_id': 1, 'product_code': 'FYPA'}},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}] * (web_app.MAX_BATCH_ORDERS + 1)},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}, {'buyer_id': 1}]},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}, {'buyer_id': 'bear', 'product_code': 'FYPA'}]},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}, 'FYPA']},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}, {'buyer_id': 404, 'product_code': 'FYPA'}]},
+    {'orders': [{'buyer_id': 1, 'product_code': 'FYPA'}, {'buyer_id': 1, 'product_code': 'NOPE'}]},
+])
+def test_orders_batch_rejects_bad_requests(db, client, body):
+    db.insert_buyer(name='Bear', username='bear', icon=None)
+
+    response = client.post('/orders/batch', json=body)
+    assert response.status_code == 400
+    assert not response.get_json()['ok']
+    assert db.get_all_orders() == []
+
+
+def test_events_stream_ends_with_resume_id(db, client, monkeypatch):
+    monkeypatch.setattr(web_app, 'EVENTS_MAX_AGE', 0.1)
+    monkeypatch.setattr(web_app, 'EVENTS_POLL_INTERVAL', 0.01)
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    order = db.insert_order_at_current_price(buyer.uid, 'FYPA')
+
+    response = client.get('/events', headers={'Last-Event-ID': '0-0'})
+    body = response.get_data(as_text=True)
+    assert 'event: order' in body
+    assert body.endswith(f'id: 0-{order.uid}\n\n')
+
+
+def test_stocks_revalidated_across_orders(db, client):
+    response = client.get('/stocks.json?points=50')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    db.insert_order_at_current_price(buyer.uid, 'FYPA')
+    response = client.get('/stocks.json?points=50', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    response = client.get('/stocks.json?points=50', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_register_full_document(db, client):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    order = db.insert_order_at_current_price(buyer.uid, 'FYPA')
+
+    data = client.get('/register.json').get_json()
+    assert data['full']
+    assert [product['code'] for product in data['products']] == ['FYPA', 'LEBL']
+    assert data['sales'] == {'FYPA': 1}
+    assert [o['id'] for o in data['orders']] == [order.uid]
+    assert data['orders'][0]['product']['code'] == 'FYPA'
+    assert data['orders'][0]['price'] == 36
+
+
+def test_events_resync_when_too_many_ticks_missed(db, client, monkeypatch):
+    monkeypatch.setattr(web_app, 'EVENTS_MAX_AGE', 0.1)
+    monkeypatch.setattr(web_app, 'EVENTS_POLL_INTERVAL', 0.01)
+    monkeypatch.setattr(web_app, 'EVENTS_MAX_REPLAY', 1)
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    assert [tick.tick_no for tick in db.get_ticks_since(0, limit=1)] == [1]
+
+    response = client.get('/events', headers={'Last-Event-ID': '0-0'})
+    body = response.get_data(as_text=True)
+    assert 'event: tick' not in body
+    assert 'event: resync' in body
+    assert body.endswith('id: 2-0\n\n')
@@ -0,0 +1,604 @@
+import gzip
+import json
+import os
+import pickle
+import sqlite3
+
+import pytest
+
+from bearstock.database import (
+    BearDatabaseError, ConnectionPool, ConnectionProfile, Database, Product, RecentOrders,
+)
+from bearstock.statistics import get_top_bot
+
+SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', 'schema.sql')
+
+
+def create_schema(db):
+    db.execute_script(open(SCHEMA_FILE).read())
+
+
+@pytest.fixture
+def db(tmpdir):
+    db = Database(str(tmpdir.join('bear-test.db')))
+    db.connect()
+    create_schema(db)
+
+    db.import_products([
+        {'code': 'FYPA', 'name': 'Pale Ale', 'producer': 'Frydenlund', 'type': 'beer',
+         'tags': [], 'base_price': 35, 'quantity': 100, 'hidden': False},
+        {'code': 'LEBL', 'name': 'Blonde', 'producer': 'Leffe', 'type': 'beer',
+         'tags': [], 'base_price': 43, 'quantity': 100, 'hidden': False},
+    ])
+    db.do_tick({'FYPA': 0, 'LEBL': 0}, tick_no=0)
+
+    yield db
+    db.close()
+
+
+def test_tick_prices_history(db):
+    db.do_tick({'FYPA': 250, 'LEBL': -120})
+    db.do_tick({'FYPA': 310, 'LEBL': -80})
+
+    assert db.get_product_price_adjustment('FYPA') == 310
+    assert db.get_product_historic_prices('LEBL').adjustments == [0, -120, -80]
+
+    history = db.get_all_product_historic_prices()
+    assert history['FYPA'].adjustments == [0, 250, 310]
+    assert history['FYPA'].prices == [35, 38, 38]
+
+
+def test_migrate_pickled_ticks(tmpdir):
+    path = str(tmpdir.join('bear-old.db'))
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE ticks ( '
+        '  tick_no INTEGER PRIMARY KEY AUTOINCREMENT, '
+        "  timestamp INTEGER NOT NULL DEFAULT (strftime('%s', 'now')), "
+        '  price_adjustments BLOB NOT NULL )')
+    connection.executemany(
+        'INSERT INTO ticks ( tick_no, price_adjustments ) VALUES ( ?, ? )',
+        [(0, pickle.dumps({'FYPA': 0})), (1, pickle.dumps({'FYPA': 150}))])
+    connection.commit()
+    connection.close()
+
+    db = Database(path)
+    db.connect()
+    create_schema(db)
+    db.migrate()
+
+    assert db.get_product_price_adjustment('FYPA') == 150
+    assert db.get_tick_number() == 1
+    db.migrate()  # no-op on a migrated database
+
+    generation = db.generation
+    db.do_tick({'FYPA': 200})
+    assert db.generation == generation + 1
+    db.close()
+
+
+def test_catalog_snapshot_matches_products(db):
+    db.do_tick({'FYPA': 250, 'LEBL': -120})
+    product = db.get_product('LEBL')
+    product.hidden = True
+
+    catalog = db.get_catalog_snapshot()
+    assert [entry.product.code for entry in catalog] == ['FYPA']
+
+    entry = catalog[0]
+    product = db.get_product('FYPA')
+    assert entry.current_price == product.current_price
+    assert entry.price_adjustment == product.price_adjustment
+    assert entry.timeline == product.timeline
+
+
+def test_tick_history_loads_new_ticks(db):
+    assert db.get_product_historic_prices('FYPA').adjustments == [0]
+    assert db.tick_history.last_tick == 0
+
+    db.do_tick({'FYPA': 250, 'LEBL': -120})
+    assert db.get_product_historic_prices('FYPA').adjustments == [0, 250]
+    assert db.tick_history.last_tick == 1
+
+    product = db.get_product('FYPA')
+    product.base_price = 40
+    assert product.timeline.prices == [40, 42]
+
+    # ticks rewritten by another process, for instance by bear_setup
+    db.exe('DELETE FROM ledger WHERE tick_no > 0')
+    db.exe('DELETE FROM tick_prices WHERE tick_no > 0')
+    db.exe('DELETE FROM ticks WHERE tick_no > 0')
+    db.exe('UPDATE tick_prices SET adjustment = 100')
+    assert db.get_product_historic_prices('FYPA').adjustments == [100]
+    assert db.tick_history.last_tick == 0
+
+
+def test_connection_pool_reuses_connections(tmpdir):
+    path = str(tmpdir.join('bear-pool.db'))
+    pool = ConnectionPool(path, size=1, timeout=0.01)
+
+    db = Database(path, pool=pool)
+    db.connect()
+    connection = db.connection
+    with pytest.raises(BearDatabaseError):
+        Database(path, pool=pool).connect()  # pool exhausted
+    db.close()
+
+    db.connect()
+    assert db.connection is connection
+    db.close()
+
+    connection.close()  # a broken connection is replaced
+    db.connect()
+    assert db.connection is not connection
+    db.close()
+    pool.close()
+
+
+def test_concurrent_profile_uses_wal(tmpdir):
+    db = Database(str(tmpdir.join('bear-wal.db')))
+    db.connect(profile=ConnectionProfile.CONCURRENT)
+    create_schema(db)
+    db.do_tick({'FYPA': 0}, tick_no=0)
+
+    assert db.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    busy, log_pages, checkpointed = db.checkpoint()
+    assert busy == 0 and checkpointed == log_pages
+    db.close()
+
+
+def test_hot_order_queries_use_indexes(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('FYPA')
+    db.insert_order(buyer=buyer, product=product, relative_cost=0, tick_no=0)
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    db.get_product_sold_per_tick('FYPA')
+    db.relative_cost_stats_for(buyer)
+    db.get_last_order_by(buyer)
+    db.get_latest_orders(count=30)
+    db.get_orders_after(0)
+    db.get_orders_befores(0)
+    db.get_tick_last_timestamp()
+    db.get_orders_since(0)
+    db.get_ticks_since(0)
+    db.connection.set_trace_callback(None)
+
+    for sql in statements:
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        # index ordered scans are fine, they stop at the limit
+        plan = [row[3] for row in db.connection.execute(f'EXPLAIN QUERY PLAN {sql}')]
+        assert not {'SCAN orders', 'SCAN ticks', 'SCAN tick_prices'} & set(plan), (sql, plan)
+        assert not any('TEMP B-TREE' in step for step in plan), (sql, plan)
+
+
+def test_transaction_commits_once_and_rolls_back(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('FYPA')
+
+    commits = []
+    db.connection.set_trace_callback(commits.append)
+    with db.transaction():
+        db.insert_order(buyer=buyer, product=product, relative_cost=0, tick_no=0)
+        with db.transaction():
+            db.insert_order(buyer=buyer, product=product, relative_cost=1, tick_no=0)
+    db.connection.set_trace_callback(None)
+    assert [sql for sql in commits if sql == 'COMMIT'] == ['COMMIT']
+
+    with pytest.raises(BearDatabaseError):
+        with db.transaction():
+            db.insert_order(buyer=buyer, product=product, relative_cost=2, tick_no=0)
+            db.insert_order(buyer=buyer, product=product, relative_cost=3, tick_no=404)
+    assert db.relative_cost_stats_for(buyer) == {'sum': 1, 'count': 2}
+
+
+def test_import_orders(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('LEBL')
+    db.import_orders([
+        {'buyer': buyer, 'product': product, 'relative_cost': cost, 'tick_no': 0}
+        for cost in range(100)
+    ])
+    assert db.relative_cost_stats_for(buyer) == {'sum': 4950, 'count': 100}
+
+
+def test_buyer_stats_rollup(db):
+    bear = db.insert_buyer(name='Bear', username='bear', icon=None)
+    fox = db.insert_buyer(name='Fox', username='fox', icon='F')
+    product = db.get_product('FYPA')
+    db.insert_order(buyer=bear, product=product, relative_cost=3, tick_no=0, created_at=100)
+    db.insert_order(buyer=bear, product=product, relative_cost=-1, tick_no=0, created_at=200)
+
+    expected = {
+        bear.uid: {'sum': 2, 'count': 2, 'last_order_at': 200},
+        fox.uid: {'sum': 0, 'count': 0, 'last_order_at': None},
+    }
+    assert db.get_all_buyer_cost_stats() == expected
+    assert db.relative_cost_stats_for(bear) == {'sum': 2, 'count': 2}
+
+    db.exe('DELETE FROM buyer_stats')
+    db.migrate()
+    assert db.get_all_buyer_cost_stats() == expected
+
+
+def test_tick_sales_rollup(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    fypa, lebl = db.get_product('FYPA'), db.get_product('LEBL')
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=2, tick_no=0)
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=0, tick_no=1)
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=1, tick_no=1)
+    db.insert_order(buyer=buyer, product=lebl, relative_cost=0, tick_no=1)
+
+    expected = {'FYPA': [1, 2], 'LEBL': [0, 1]}
+    assert db.get_all_products_sold_per_tick(['LEBL']) == expected
+    assert db.get_product_sold_per_tick('FYPA') == [1, 2]
+
+    def revenue(cursor):
+        return cursor.fetchone()[0]
+    assert db.exe('SELECT SUM(revenue) FROM tick_sales', callable=revenue) == 3*35 + 3 + 43
+
+    db.rebuild_tick_sales()
+    assert db.get_all_products_sold_per_tick() == expected
+
+    # sales of a tick done after the tick number was read are left out
+    db.exe('INSERT INTO tick_sales ( tick_no, product_code, units ) VALUES ( 2, :code, 1 )',
+           args={'code': 'FYPA'})
+    assert db.get_all_products_sold_per_tick(['LEBL']) == expected
+    assert db.get_product_sold_per_tick('FYPA') == [1, 2]
+
+
+def test_generation_follows_changes(db):
+    generation = db.generation
+    assert db.generation == generation
+
+    db.do_tick({'FYPA': 100, 'LEBL': 0})
+    assert db.generation == generation + 1
+
+    product = db.get_product('FYPA')
+    product.base_price = 40
+    assert db.generation == generation + 2
+
+    # a change from another connection
+    other = Database(db.dbname)
+    other.connect()
+    other.set_config_quarantine(30)
+    other.close()
+    assert db.generation == generation + 3
+
+
+def test_memoized_values_forget_rolled_back_changes(db):
+    generation = db.generation
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.do_tick({'FYPA': 100, 'LEBL': 0})
+            assert db.tick_number == 1
+            assert db.generation == generation + 1
+            raise ValueError()
+
+    assert db.tick_number == db.get_tick_number() == 0
+    assert db.generation == db.config.generation == generation
+    assert db.get_product('FYPA').current_price == 35
+
+
+def test_config_snapshot_is_reused_until_written(db):
+    db.set_config_tick_length(300)
+    db.set_config_stock_running(True)
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    assert db.get_config_tick_length() == 300
+    assert db.get_config_stock_running()
+    assert db.get_config_quarantine() is None
+    db.connection.set_trace_callback(None)
+    assert [sql for sql in statements if 'FROM config' in sql] == ['SELECT name, int_value FROM config']
+
+    db.set_config_stock_running(False)
+    assert not db.get_config_stock_running()
+
+
+def test_row_reads_match_models(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('FYPA')
+    db.insert_order(buyer=buyer, product=product, relative_cost=2, tick_no=0)
+
+    assert [row.as_dict() for row in db.get_all_buyers(rows=True)] == \
+        [buyer.as_dict(with_last_order=False) for buyer in db.get_all_buyers()]
+    assert [row.as_dict() for row in db.get_all_products(rows=True)] == \
+        [product.as_dict() for product in db.get_all_products()]
+    assert [row.as_dict() for row in db.get_all_orders(rows=True)] == \
+        [order.as_dict() for order in db.get_all_orders()]
+
+
+def test_batch_and_deferred_writes(db):
+    products = db.get_all_products()
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    with db.batch():
+        for product in products:
+            product.base_price += 5
+            product.name = product.name.upper()
+    db.connection.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert [p.base_price for p in db.get_all_products()] == [40, 48]
+
+    product = db.get_product('FYPA')
+    statements.clear()
+    db.connection.set_trace_callback(statements.append)
+    with product.deferred():
+        product.producer = 'Ringnes'
+        product.hidden = True
+    db.connection.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert db.get_product('FYPA').producer == 'Ringnes'
+
+    # a raising block discards its changes, also for the next block
+    with pytest.raises(ValueError):
+        with product.deferred():
+            product.name = 'bad'
+            raise ValueError()
+    with product.deferred():
+        pass
+    assert db.get_product('FYPA').name != 'bad'
+
+    # unbound models are not written, deferred or not
+    unbound = Product(code='NEW', name='New', producer='', type='beer', tags=[],
+                      base_price=30, quantity=10)
+    with unbound.deferred():
+        unbound.name = 'Newer'
+    assert unbound.name == 'Newer'
+
+
+def test_product_derived_values_memoized_per_tick(db):
+    product = db.get_product('FYPA')
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    for _ in range(3):
+        assert product.current_price == 35
+        assert product.timeline.adjustments == [0]
+    db.connection.set_trace_callback(None)
+    assert len([sql for sql in statements if 'FROM tick_prices' in sql]) == 1
+
+    db.do_tick({'FYPA': 500, 'LEBL': 0})
+    assert product.price_adjustment == 500
+    assert product.current_price == 40
+    assert product.timeline.prices == [35, 40]
+
+    product.base_price = 30
+    assert product.current_price == 35
+
+
+def test_version_token_follows_changes(db):
+    token = db.get_version_token()
+    assert db.get_version_token() == token
+
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    assert db.get_version_token() != token
+
+    token = db.get_version_token()
+    db.insert_order(buyer=buyer, product=db.get_product('FYPA'), relative_cost=0, tick_no=0)
+    assert db.get_version_token() != token
+
+    token = db.get_version_token()
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    assert db.get_version_token().startswith('1-')
+
+
+def test_orders_and_ticks_since(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('FYPA')
+    assert db.get_last_order_id() == 0
+
+    for cost in range(3):
+        db.insert_order(buyer=buyer, product=product, relative_cost=cost, tick_no=0)
+    first = db.get_orders_since(0, limit=1)[0].uid
+    assert [row.relative_cost for row in db.get_orders_since(first)] == [1, 2]
+    assert db.get_last_order_id() == first + 2
+
+    db.do_tick({'FYPA': 150})
+    ticks = db.get_ticks_since(0)
+    assert [(tick.tick_no, tick.adjustments) for tick in ticks] == [(1, {'FYPA': 150})]
+    assert db.get_ticks_since(1) == []
+
+
+def test_board_snapshot_is_reused_until_stale(db):
+    snapshot = db.publish_board_snapshot()
+    products = [entry.as_dict() for entry in db.get_catalog_snapshot()]
+    assert json.loads(snapshot.body) == json.loads(json.dumps({'products': products}))
+    assert gzip.decompress(snapshot.body_gzip) == snapshot.body
+    assert db.get_board_snapshot() == snapshot
+
+    # orders are sent as the sales of the current tick, not rendered into the board
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    db.insert_order_at_current_price(buyer.uid, 'FYPA')
+    assert db.get_board_snapshot() == snapshot
+    db.connection.set_trace_callback(None)
+    assert not [sql for sql in statements if 'INTO snapshots' in sql]
+    assert db.get_tick_sales(0) == {'FYPA': 1}
+
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    snapshot = db.get_board_snapshot()
+    assert snapshot.tick_no == 1
+    assert json.loads(snapshot.body)['products'][0]['timeline'][3] == [1, 0]
+    assert db.get_tick_sales(1) == {}
+
+    product = db.get_product('LEBL')
+    product.hidden = True
+    stale = snapshot
+    snapshot = db.get_board_snapshot()
+    assert snapshot.catalog > stale.catalog
+    assert [p['code'] for p in json.loads(snapshot.body)['products']] == ['FYPA']
+    assert db.get_board_snapshot() == snapshot
+
+
+def test_insert_orders_in_one_transaction(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    fypa, lebl = db.get_product('FYPA'), db.get_product('LEBL')
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    orders = db.insert_orders([
+        {'buyer': buyer, 'product': product, 'relative_cost': 1, 'tick_no': 0}
+        for product in (fypa, lebl, fypa)
+    ])
+    db.connection.set_trace_callback(None)
+    assert statements.count('COMMIT') == 1
+    assert [order.as_dict() for order in orders] == \
+        [order.as_dict() for order in db.get_all_orders()]
+
+    with pytest.raises(BearDatabaseError):
+        db.insert_orders([
+            {'buyer': buyer, 'product': fypa, 'relative_cost': 0, 'tick_no': 0},
+            {'buyer': buyer, 'product': fypa, 'relative_cost': 0, 'tick_no': 404},
+        ])
+    assert len(db.get_all_orders()) == 3
+
+
+def test_insert_order_at_current_price(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    db.do_tick({'FYPA': 150, 'LEBL': -150})
+
+    # 36.5 rounds to even like in Product.current_price, not up like SQLite's round()
+    for code in ('FYPA', 'LEBL'):
+        order = db.insert_order_at_current_price(buyer.uid, code)
+        product = db.get_product(code)
+        assert order.tick_no == 1
+        assert product.base_price + order.relative_cost == product.current_price
+
+    with pytest.raises(ValueError):
+        db.insert_order_at_current_price(buyer.uid, 'NOPE')
+    with pytest.raises(BearDatabaseError):
+        db.insert_order_at_current_price(404, 'FYPA')
+
+    fypa, lebl = db.get_product('FYPA'), db.get_product('LEBL')
+    orders = db.insert_orders_at_current_price([
+        {'buyer': buyer, 'product': product} for product in (fypa, lebl)
+    ])
+    assert [order.as_dict() for order in orders] == \
+        [order.as_dict() for order in db.get_all_orders()[-2:]]
+    assert [order.relative_cost for order in orders] == [1, -1]
+
+    db.exe("DELETE FROM tick_prices WHERE product_code = 'LEBL' AND tick_no = 1")
+    with pytest.raises(ValueError):
+        db.insert_orders_at_current_price([
+            {'buyer': buyer, 'product': product} for product in (fypa, lebl)
+        ])
+    assert len(db.get_all_orders()) == 4
+
+
+def test_recent_orders_buffer(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    product = db.get_product('FYPA')
+    for cost in range(3):
+        db.insert_order(buyer=buyer, product=product, relative_cost=cost, tick_no=0)
+    assert [row.relative_cost for row in db.get_recent_orders(2)] == [2, 1]
+
+    statements = []
+    db.connection.set_trace_callback(statements.append)
+    assert len(db.get_recent_orders(30, last_order_id=db.get_last_order_id())) == 3
+    db.connection.set_trace_callback(None)
+    assert not any('FROM orders WHERE' in sql for sql in statements)
+
+    # an order taken by another worker
+    other = Database(db.dbname)
+    other.connect()
+    other.insert_order(buyer=buyer, product=product, relative_cost=3, tick_no=0)
+    other.close()
+    order = db.insert_order(buyer=buyer, product=product, relative_cost=4, tick_no=0)
+    RecentOrders.for_file(db.dbname).add([order.as_row()])  # not after the last seen
+    assert [row.relative_cost for row in db.get_recent_orders(30)] == [4, 3, 2, 1, 0]
+
+
+def test_leaderboard(db):
+    bear = db.insert_buyer(name='Bear', username='bear', icon='B')
+    fox = db.insert_buyer(name='Fox', username='fox', icon='F')
+    db.insert_buyer(name='Owl', username='owl', icon='O')
+    fypa = db.get_product('FYPA')
+    db.insert_order(buyer=bear, product=fypa, relative_cost=-5, tick_no=0)
+    db.insert_order(buyer=fox, product=fypa, relative_cost=3, tick_no=0)
+    db.insert_order(buyer=fox, product=fypa, relative_cost=1, tick_no=0)
+
+    top_bot = get_top_bot(5, db)
+    assert top_bot['count'] == 2
+    assert [(t['username'], t['profit'], t['turnover']) for t in top_bot['top']] == \
+        [('bear', 5, 30), ('fox', -4, 74)]
+    assert [t['username'] for t in top_bot['bottom']] == ['fox', 'bear']
+
+    plan = [row[3] for row in db.connection.execute(
+        'EXPLAIN QUERY PLAN SELECT buyer_id FROM buyer_stats ORDER BY relative_cost_sum LIMIT 3')]
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_ledger_running_totals(db):
+    buyer = db.insert_buyer(name='Bear', username='bear', icon=None)
+    fypa = db.get_product('FYPA')
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=2, tick_no=0)
+    db.do_tick({'FYPA': 0, 'LEBL': 0})
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=-5, tick_no=1)
+    db.insert_order(buyer=buyer, product=fypa, relative_cost=1, tick_no=0)
+
+    assert db.get_purchase_surplus() == -2
+    assert db.get_ledger_totals() == {
+        'tick_no': 1, 'surplus': -2, 'subsidy': 2, 'revenue': 3*35 - 2, 'units': 3}
+    assert db.audit_ledger() == []
+
+    db.exe('UPDATE ledger SET units = 0 WHERE tick_no = 0')
+    assert db.audit_ledger() == [((0, 3, 73, 0), (0, 3, 73, 2))]
+    db.rebuild_ledger()
+    assert db.audit_ledger() == []
+
+    db.exe('DELETE FROM ledger')
+    db.migrate()
+    assert db.get_purchase_surplus() == -2
+
+    # revenue is kept at the base prices the orders were made at
+    fypa.base_price = 100
+    db.rebuild_tick_sales()
+    db.rebuild_ledger()
+    assert db.get_ledger_totals()['revenue'] == 3*35 - 2
+    assert db.audit_ledger() == []
+
+
+def test_migrate_order_base_prices(tmpdir):
+    path = str(tmpdir.join('bear-old.db'))
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        'CREATE TABLE products ( '
+        '  code TEXT PRIMARY KEY, name TEXT NOT NULL, producer TEXT NOT NULL, '
+        '  base_price INTEGER NOT NULL, quantity INTEGER NOT NULL, type TEXT NOT NULL, '
+        '  tags TEXT NOT NULL, hidden BOOLEAN NOT NULL DEFAULT 0 ); '
+        'CREATE TABLE orders ( '
+        '  id INTEGER PRIMARY KEY AUTOINCREMENT, buyer_id INTEGER NOT NULL, '
+        '  product_code TEXT NOT NULL, relative_cost INTEGER NOT NULL, '
+        "  tick_no INTEGER NOT NULL, created_at INTEGER NOT NULL DEFAULT (strftime('%s','now')) ); "
+        'CREATE TABLE buyers ( '
+        '  id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, name TEXT, '
+        "  scaling REAL NOT NULL, icon TEXT UNIQUE, created_at INTEGER NOT NULL DEFAULT (strftime('%s','now')) ); "
+        "INSERT INTO buyers ( username, scaling ) VALUES ( 'bear', 1 ); "
+        "INSERT INTO products VALUES ( 'FYPA', 'Pale Ale', 'Frydenlund', 35, 100, 'beer', '', 0 ); "
+        "INSERT INTO orders ( buyer_id, product_code, relative_cost, tick_no ) VALUES ( 1, 'FYPA', 2, 0 );")
+    connection.commit()
+    connection.close()
+
+    db = Database(path)
+    db.connect()
+    create_schema(db)
+    db.migrate()
+
+    def base_prices(cursor):
+        return [row[0] for row in cursor]
+    assert db.exe('SELECT base_price FROM orders ORDER BY id',
+                  callable=base_prices, plain_rows=True) == [35]
+    assert db.get_all_buyer_cost_stats()[1]['sum'] == 2
+    db.close()
+
+def test_do_tick_with_scheduled_timestamp(db):
+    db.do_tick({'FYPA': 0, 'LEBL': 0}, timestamp=1000)
+    assert db.get_tick_number() == 1
+    assert db.get_ticks_since(0)[0].timestamp == 1000
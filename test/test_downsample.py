@@ -0,0 +1,27 @@
+import pytest
+
+from bearstock.downsample import lttb
+
+
+def test_short_series_is_kept():
+    assert lttb([1, 2, 3], [5, 6, 7], 10) == ([1, 2, 3], [5, 6, 7])
+
+
+def test_downsample_keeps_ends_and_peaks():
+    xs = list(range(1000))
+    ys = [0]*1000
+    ys[500] = 100
+    ys[700] = -100
+
+    out_xs, out_ys = lttb(xs, ys, 20)
+    assert len(out_xs) == len(out_ys) == 20
+    assert out_xs[0] == 0 and out_xs[-1] == 999
+    assert out_xs == sorted(out_xs)
+    assert 100 in out_ys and -100 in out_ys
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        lttb([1, 2], [1], 3)
+    with pytest.raises(ValueError):
+        lttb([1, 2, 3], [1, 2, 3], 2)
@@ -0,0 +1,14 @@
+from bearstock.stock import Exchange, next_tick_due
+
+
+def test_ticks_are_aligned_to_the_schedule():
+    # on time, late, and a whole tick late
+    assert next_tick_due(1000, 60, 1030.5) == (1060, False)
+    assert next_tick_due(1000, 60, 1075.0) == (1060, False)
+    assert next_tick_due(1000, 60, 1130.0) == (1190, True)
+    assert next_tick_due(None, 60, 1000.0) == (1060, True)
+
+
+def test_wake_without_exchange(tmpdir, monkeypatch):
+    monkeypatch.setattr(Exchange, 'WAKEUP_SOCKET', str(tmpdir.join('missing.sock')))
+    assert not Exchange.wake()